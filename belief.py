@@ -0,0 +1,160 @@
+'''
+MIT License
+
+Copyright (c) 2023 Brian Stormont
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+# Where could Jack be?  Works it out from what the investigators know: this round's crime, how many
+# moves Jack has made (and which were boats, alleys or coaches), where the investigators stood when he
+# moved, and where clues were and were not found.
+#
+# Every set of locations is an int bitset over the board's vertex ids (see board.bitset()).  Jack's
+# position after each of his moves this round is kept as one bitset, and a move grows it by OR-ing
+# together the move rows of the locations in it.  When a search rules a location out (or a clue shows
+# where Jack has been), the round is played forward again from the crime with the new knowledge.
+
+from graph_data import *
+import board
+
+# A coach lets Jack walk two moves, straight past the investigators
+COACH_LEG = -1
+
+class BeliefTracker:
+    def __init__(self):
+        self.reset()
+
+    # Forget everything, e.g. for a new game
+    def reset(self):
+        self.round = 0
+        self.crime = None
+        self.steps = []          # (kind, bitset of the investigators' crossings) for each move this round
+        self.clues = []          # (vertex id, number of moves Jack had made) for each clue found this round
+        self.searched = []       # (vertex id, number of moves Jack had made) for each search that found nothing
+        self.positions = None    # where Jack could have been after each move, worked out when asked for
+        self.now = None          # where he could be now, likewise
+
+    def start_round(self, crime):
+        self.crime = board.node_id[crime]
+        self.steps = []
+        self.clues = []
+        self.searched = []
+        self.positions = None
+        self.now = None
+
+    # Jack made one move of the given travel type (NORMAL_MOVE, BOAT_MOVE, ALLEY_MOVE or COACH_MOVE)
+    # while the investigators stood at `ipos`
+    def jack_moved(self, travel, ipos):
+        blocked = board.bitset(board.node_id[pos] for pos in ipos)
+        steps = [(COACH_LEG, blocked)] * 2 if travel == COACH_MOVE else [(travel, blocked)]
+        for kind, blocked in steps:
+            self.steps.append((kind, blocked))
+            # Nothing else changed, so the positions so far still hold.  Searches only tell where Jack had
+            # been before them, so they say nothing about this move.
+            if self.positions is not None:
+                self.positions.append(self.expand(self.positions[-1], kind, blocked))
+        self.now = None
+
+    def clue_found(self, location):
+        self.clues.append((board.node_id[location], len(self.steps)))
+        self.now = None
+
+    def no_clue(self, location):
+        self.searched.append((board.node_id[location], len(self.steps)))
+        self.positions = None
+        self.now = None
+
+    # Catch up with the public state of `jack`: his crimes, the length of his path this round, and the
+    # clues found and not found.  Call it after every move of Jack's, with the special travel he announced.
+    def follow(self, jack, travel=NORMAL_MOVE):
+        if not jack.crimes:
+            return
+        if len(jack.crimes) != self.round:
+            self.round = len(jack.crimes)
+            self.start_round(jack.crimes[-1])
+        moves = len(jack.path_used) - 1 - len(self.steps)
+        if moves > 0:
+            # Only a coach moves Jack twice in one go
+            self.jack_moved(travel if moves == 1 else COACH_MOVE, jack.ipos)
+        for location in jack.clues[len(self.clues):]:
+            self.clue_found(location)
+        for location in jack.searched[len(self.searched):]:
+            self.no_clue(location)
+
+    # The locations reachable with one move of `kind` from any location in `bits`
+    def expand(self, bits, kind, blocked):
+        moves = 0
+        for v in board.bit_ids(bits):
+            if kind == NORMAL_MOVE:
+                row = board.cached_walk_moves(v, blocked)
+            elif kind == COACH_LEG:
+                row = board.jack_moves(v)
+            else:
+                row = board.jack_moves(v, kind)
+            moves |= row
+        return moves
+
+    # Where Jack could have been after each move this round, [crime, after move 1, ...] as bitsets.
+    # A search that found nothing rules its location out for every move made before it.
+    def compute_positions(self):
+        ruled_out = [0] * (len(self.steps) + 1)
+        for location, moves in self.searched:
+            for move in range(1, moves + 1):
+                ruled_out[move] |= 1 << location
+        positions = [1 << self.crime]
+        for move, (kind, blocked) in enumerate(self.steps, 1):
+            positions.append(self.expand(positions[-1], kind, blocked) & ~ruled_out[move])
+        return positions
+
+    # Where Jack could be now if he was at `clue` after one of his first `moves` moves
+    def through(self, clue, moves):
+        clue_bit = 1 << clue
+        bits = 0
+        for move, (kind, blocked) in enumerate(self.steps, 1):
+            bits = self.expand(bits, kind, blocked)
+            if move <= moves:
+                bits |= clue_bit
+            bits &= self.positions[move]
+        return bits
+
+    # Bitset of the locations Jack could be at now
+    def possible(self):
+        if self.crime is None:
+            return 0
+        if self.positions is None:
+            self.positions = self.compute_positions()
+        if self.now is None:
+            self.now = self.positions[-1]
+            for clue, moves in self.clues:
+                self.now &= self.through(clue, moves)
+        return self.now
+
+    def possible_locations(self):
+        return board.bitset_names(self.possible())
+
+    # Every location Jack might have visited this round (the ones worth searching for clues)
+    def possible_trail(self):
+        if self.crime is None:
+            return 0
+        self.possible()
+        trail = 0
+        for bits in self.positions[1:]:
+            trail |= bits
+        return trail
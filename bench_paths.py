@@ -0,0 +1,93 @@
+'''
+MIT License
+
+Copyright (c) 2023 Brian Stormont
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+# Compares the two ways of picking a random shortest path for Jack on long trips across the board:
+# listing every shortest path and choosing one, versus drawing one straight from the path counts.
+#
+#   python bench_paths.py [number of pairs] [repeats]
+
+import random
+import sys
+import time
+import tracemalloc
+
+import board
+from board import WeightOverlay
+from graph_data import *
+from jack import DEFAULT_WATER_WEIGHT, DEFAULT_ALLEY_WEIGHT
+from paths import CsrPaths
+
+def list_based(paths, src, dest, overlay):
+    return random.choice(list(paths.all_shortest_paths(src, dest, overlay, 'weight')))
+
+def sampled(paths, src, dest, overlay):
+    return paths.random_shortest_path(src, dest, overlay, 'weight')
+
+# The `count` location pairs that are furthest apart, which are also the ones with the most tied paths
+def long_pairs(paths, overlay, count):
+    pairs = []
+    for src in board.locations:
+        dist = paths.graph.dijkstra(board.node_id[src], overlay, 'weight')
+        for v, d in dist.items():
+            if board.node_names[v] in board.locations:
+                pairs.append((d, src, board.node_names[v]))
+    pairs.sort(key=lambda p: (-p[0], int(p[1]), int(p[2])))
+    return pairs[:count]
+
+def measure(pick, paths, pairs, overlay, repeats):
+    start = time.perf_counter()
+    for i in range(repeats):
+        for d, src, dest in pairs:
+            pick(paths, src, dest, overlay)
+    per_call = (time.perf_counter() - start) / (repeats * len(pairs))
+
+    peak = 0
+    for d, src, dest in pairs:
+        tracemalloc.start()
+        pick(paths, src, dest, overlay)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return per_call, peak
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    paths = CsrPaths()
+    # Jack's usual view of the board: boats and alleys available at their normal cost
+    overlay = WeightOverlay()
+    overlay.set_travel_weight(BOAT_MOVE, DEFAULT_WATER_WEIGHT)
+    overlay.set_travel_weight(ALLEY_MOVE, DEFAULT_ALLEY_WEIGHT)
+
+    pairs = long_pairs(paths, overlay, count)
+    tied = [sum(1 for p in paths.all_shortest_paths(src, dest, overlay, 'weight')) for d, src, dest in pairs]
+    print("%d pairs, %d to %d moves apart, %d to %d shortest paths each" %
+          (len(pairs), pairs[-1][0], pairs[0][0], min(tied), max(tied)))
+
+    for name, pick in (("list all paths", list_based), ("sample from counts", sampled)):
+        per_call, peak = measure(pick, paths, pairs, overlay, repeats)
+        print("%-20s %8.3f ms/path  %8.1f KiB peak" % (name, per_call * 1000, peak / 1024))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,561 @@
+'''
+MIT License
+
+Copyright (c) 2023 Brian Stormont
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+# Static lookup tables for the board map, plus the weight layers Jack puts on top of them.
+# The shape of the map never changes during a game, so anything that only depends on
+# `graph_data` is computed here once per process and shared by every Jack.
+
+import hashlib
+import heapq
+import mmap
+import os
+import struct
+from array import array
+from collections import deque
+from itertools import count
+from graph_data import *
+import graph_data
+
+# Weight given to paths Jack is not allowed to use
+POISON = 1000
+
+# Compact integer ids for every vertex, in the order they appear in `positions`
+node_names = [name for name, (x, y) in positions]
+node_id = {name: num for num, name in enumerate(node_names)}
+
+# Kind flags for every vertex, so nothing has to look for a 'c' in the name to tell crossings from locations
+CROSSING = 1
+LOCATION = 2
+WATER = 4
+QUAD_TARGET = 8
+STARTING_CROSSING = 16
+
+def classify(name):
+    kind = CROSSING if 'c' in name else LOCATION
+    if name in water:
+        kind |= WATER
+    if any(name in q for q in quads):
+        kind |= QUAD_TARGET
+    if name in starting_ipos:
+        kind |= STARTING_CROSSING
+    return kind
+
+
+# The tables below only depend on the map, so they are compiled into this file the first time they are
+# built and mapped straight into memory by later processes (every simulation and what-if worker) instead
+# of being worked out from graph_data again.  If the file can't be written, the tables are simply built
+# in every process.  `python board.py` compiles it ahead of time.
+# The file records a hash of the sources it was compiled from (graph_data.py and this file), and is
+# ignored and compiled again when it no longer matches.
+#
+# Layout: a header (magic, version, source hash, vertex count, edge count) followed by the arrays
+# offsets, targets, weight and i_weight (int32), then node_kind and transport (bytes).
+BOARD_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "board_cache.bin")
+BOARD_CACHE_MAGIC = b"WHBD"
+BOARD_CACHE_VERSION = 1
+board_cache_header = struct.Struct("<4sI32sII")
+
+def source_hash():
+    digest = hashlib.sha256()
+    for filename in (graph_data.__file__, __file__):
+        with open(filename, 'rb') as f:
+            digest.update(f.read())
+    return digest.digest()
+
+# (name, typecode, length) of each array in the file, for `vertices` vertices and `edges` edges
+def board_cache_layout(vertices, edges):
+    return [("offsets", 'i', vertices + 1), ("targets", 'i', edges), ("weight", 'i', edges), ("i_weight", 'i', edges),
+            ("node_kind", 'B', vertices), ("transport", 'B', edges)]
+
+# {name: array} read from the compiled board without copying it, or None if there is no up to date one
+def load_board_cache(filename=BOARD_CACHE):
+    try:
+        with open(filename, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, key, vertices, edges = board_cache_header.unpack_from(data)
+        if magic != BOARD_CACHE_MAGIC or version != BOARD_CACHE_VERSION or vertices != len(node_names) or key != source_hash():
+            return None
+    except (OSError, ValueError, struct.error):
+        return None
+
+    view = memoryview(data)
+    arrays = {}
+    offset = board_cache_header.size
+    for name, typecode, length in board_cache_layout(vertices, edges):
+        size = length * struct.calcsize(typecode)
+        if offset + size > len(data):
+            return None
+        arrays[name] = view[offset:offset + size].cast(typecode)
+        offset += size
+    return arrays
+
+# Save `data` (bytes) as `filename` by writing a temporary file and moving it into place, so a process
+# starting up at the same time never reads half a file.  Used for the caches, which are all worked out
+# again when they can't be read, so not being able to save (e.g. the game is installed in a directory
+# the player can't write to) is fine: nothing is left behind and it just returns False.
+def atomic_write(filename, data):
+    temp = "%s.%d" % (filename, os.getpid())
+    try:
+        with open(temp, 'wb') as f:
+            f.write(data)
+        os.replace(temp, filename)
+        return True
+    except OSError:
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+        return False
+
+def save_board_cache(g, filename=BOARD_CACHE):
+    vertices = len(node_names)
+    edges = len(g.targets)
+    arrays = {"offsets": g.offsets, "targets": g.targets, "weight": g.weight, "i_weight": g.i_weight,
+              "node_kind": node_kind, "transport": g.transport}
+    data = [board_cache_header.pack(BOARD_CACHE_MAGIC, BOARD_CACHE_VERSION, source_hash(), vertices, edges)]
+    for name, typecode, length in board_cache_layout(vertices, edges):
+        data.append(array(typecode, arrays[name]).tobytes())
+    atomic_write(filename, b"".join(data))
+
+compiled_board = load_board_cache()
+
+# Indexed by vertex id
+if compiled_board is not None:
+    node_kind = compiled_board["node_kind"]
+else:
+    node_kind = array('B', [classify(name) for name in node_names])
+
+# The same registry as sets of names, for the code that works with vertex names
+def names_of_kind(kind):
+    return frozenset(name for name, k in zip(node_names, node_kind) if k & kind)
+
+crossings = names_of_kind(CROSSING)
+locations = names_of_kind(LOCATION)
+water_locations = names_of_kind(WATER)
+quad_targets = names_of_kind(QUAD_TARGET)
+starting_crossings = names_of_kind(STARTING_CROSSING)
+
+# Number of locations (not crossings) along a path of vertex names
+def location_count(path):
+    return sum(map(locations.__contains__, path))
+
+# The first location after the start of a path of vertex names, i.e. where the path's first move ends
+def next_location(path):
+    index = 1
+    while path[index] in crossings:
+        index += 1
+    return path[index]
+
+
+# The board as flat arrays in compressed sparse row form.
+# The outbound edges of vertex `u` are the slots offsets[u] to offsets[u+1]-1 of the edge arrays.
+# There is one array per weight channel plus a byte array of transport types:
+#   weight     the map weight (1 to enter a location, 0 to enter a crossing, 10 for boats and alleys)
+#   i_weight   the investigators' point of view: entering a crossing costs 1, entering a location costs 0,
+#              and boats and alleys are off limits
+# Jack's 'safety_weight' channel is the `weight` channel plus the safety penalty of the vertex being entered,
+# which comes from the overlay.
+#
+# Built from a list of (u, v, weight, transport) edges, or straight from the arrays of a compiled board.
+class CsrGraph:
+    def __init__(self, edges=None, arrays=None):
+        if arrays is not None:
+            self.offsets = arrays["offsets"]
+            self.targets = arrays["targets"]
+            self.weight = arrays["weight"]
+            self.i_weight = arrays["i_weight"]
+            self.transport = arrays["transport"]
+        else:
+            self.build(edges)
+
+        # Per-vertex tuples of (target, weight, transport) over the same arrays, for each channel.  Unpacking a tuple is
+        # much cheaper in the search loops than indexing three arrays for every edge.  These are Python objects, so
+        # every process builds its own from the mapped arrays (about 1.3ms), rather than sharing them like the arrays.
+        self.neighbors = [tuple(zip(self.targets[a:b], self.weight[a:b], self.transport[a:b]))
+                          for a, b in zip(self.offsets, self.offsets[1:])]
+        self.i_neighbors = [tuple(zip(self.targets[a:b], self.i_weight[a:b], self.transport[a:b]))
+                            for a, b in zip(self.offsets, self.offsets[1:])]
+
+    def build(self, edges):
+        # The map data has a few duplicate edges, so key by target first to keep one copy of each
+        out_edges = [{} for name in node_names]
+        for u, v, weight, transport in edges:
+            out_edges[node_id[u]][node_id[v]] = (weight, transport)
+
+        self.offsets = array('i', [0])
+        self.targets = array('i')
+        self.weight = array('i')
+        self.i_weight = array('i')
+        self.transport = array('B')
+        for u, edges_from_u in enumerate(out_edges):
+            for v, (weight, transport) in edges_from_u.items():
+                self.targets.append(v)
+                self.weight.append(weight)
+                self.transport.append(transport)
+                if transport != NORMAL_MOVE:
+                    self.i_weight.append(POISON)   # Don't use Jack's special paths (boats and alleys)
+                elif node_kind[u] & CROSSING and node_kind[v] & LOCATION:
+                    self.i_weight.append(0)
+                else:
+                    self.i_weight.append(1)
+            self.offsets.append(len(self.targets))
+
+    def out_edges(self, u):
+        return range(self.offsets[u], self.offsets[u+1])
+
+    # Dijkstra from `src` under the given overlay.
+    # Returns {vertex id: distance} in the order the vertices were settled.  If `pred` is supplied
+    # it is filled with every shortest-path predecessor of each vertex.
+    # With `targets` the search stops once they have all been reached (and, when recording predecessors,
+    # once every predecessor of each of them is known).
+    # Ties are broken exactly like networkx so both backends walk the board in the same order.
+    def dijkstra(self, src, overlay, channel='weight', targets=(), cutoff=None, pred=None):
+        if channel == 'i_weight':
+            # The investigators' weights are never adjusted
+            neighbors = self.i_neighbors
+            travel = blocked = {}
+            entry = no_entry_weights
+        else:
+            neighbors = self.neighbors
+            travel = overlay.travel_weight
+            blocked = overlay.blocked
+            entry = overlay.entry_weights(channel)
+
+        heappush = heapq.heappush
+        heappop = heapq.heappop
+        dist = {}
+        seen = {src: 0}
+        c = count()
+        fringe = [(0, next(c), src)]
+        remaining = set(targets)
+        stop = None
+        while fringe:
+            d, _, v = heappop(fringe)
+            if v in dist:
+                continue
+            if stop is not None and d > stop:
+                break
+            dist[v] = d
+            if v in remaining:
+                remaining.discard(v)
+                if not remaining:
+                    if pred is None:
+                        break
+                    # Keep settling the vertices tied with the last target so all of its predecessors get recorded
+                    stop = d
+            for u, w, transport in neighbors[v]:
+                if transport:
+                    w = travel.get(transport, w)
+                if blocked and (v, u) in blocked:
+                    w = POISON
+
+                vu_dist = d + (w + entry[u])
+                if cutoff is not None and vu_dist > cutoff:
+                    continue
+                if u in dist:
+                    if pred is not None and vu_dist == dist[u]:
+                        pred[u].append(v)
+                elif u not in seen or vu_dist < seen[u]:
+                    seen[u] = vu_dist
+                    heappush(fringe, (vu_dist, next(c), u))
+                    if pred is not None:
+                        pred[u] = [v]
+                elif pred is not None and vu_dist == seen[u]:
+                    pred[u].append(v)
+        return dist
+
+    # Breadth first search over the investigators' `i_weight` channel, whose weights are all 0 or 1
+    # (plus POISON, which is never within reach of a small cutoff).  Returns {vertex id: distance}.
+    def bfs(self, src, cutoff):
+        neighbors = self.i_neighbors
+        dist = {src: 0}
+        queue = deque([src])
+        while queue:
+            v = queue.popleft()
+            d = dist[v]
+            for u, w, transport in neighbors[v]:
+                if w > 1:
+                    continue
+                vu_dist = d + w
+                if vu_dist > cutoff or (u in dist and dist[u] <= vu_dist):
+                    continue
+                dist[u] = vu_dist
+                # Zero weight edges go to the front so vertices still come off the queue in distance order
+                if w == 0:
+                    queue.appendleft(u)
+                else:
+                    queue.append(u)
+        return dist
+
+    # {vertex id: [predecessor ids]} for every vertex on a shortest path from `src` to `dest`
+    # (and possibly a few more that tie with `dest`)
+    def shortest_path_predecessors(self, src, dest, overlay, channel='weight'):
+        pred = {src: []}
+        self.dijkstra(src, overlay, channel, targets=(dest,), pred=pred)
+        if dest not in pred:
+            raise ValueError("No path from %s to %s" % (node_names[src], node_names[dest]))
+        return pred
+
+    # Every shortest path from `src` to `dest` as lists of vertex ids, in the same order networkx produces them
+    def all_shortest_paths(self, src, dest, overlay, channel='weight'):
+        pred = self.shortest_path_predecessors(src, dest, overlay, channel)
+        if dest not in pred:
+            raise ValueError("No path from %s to %s" % (node_names[src], node_names[dest]))
+
+        seen = {dest}
+        stack = [[dest, 0]]
+        top = 0
+        while top >= 0:
+            node, i = stack[top]
+            if node == src:
+                yield [p for p, n in reversed(stack[:top + 1])]
+            if len(pred[node]) > i:
+                stack[top][1] = i + 1
+                next_node = pred[node][i]
+                if next_node in seen:
+                    continue
+                seen.add(next_node)
+                top += 1
+                if top == len(stack):
+                    stack.append([next_node, 0])
+                else:
+                    stack[top][:] = [next_node, 0]
+            else:
+                seen.discard(node)
+                top -= 1
+
+# Built once per process and shared by every game
+if compiled_board is not None:
+    graph = CsrGraph(arrays=compiled_board)
+else:
+    graph = CsrGraph(edge_list)
+    save_board_cache(graph)
+
+
+# Number of locations between any two vertices, following Jack's movement rules.
+# Normal edges keep their map weight (1 to enter a location, 0 to enter a crossing) while the boat
+# and alley edges use the supplied weights, so the table mirrors the `weight` channel Jack uses for hop counts.
+# A row is filled in with one search the first time its source is looked up; after that every lookup is O(1).
+class HopTable:
+    def __init__(self, boat_weight, alley_weight):
+        self.overlay = WeightOverlay()
+        self.overlay.set_travel_weight(BOAT_MOVE, boat_weight)
+        self.overlay.set_travel_weight(ALLEY_MOVE, alley_weight)
+        self.rows = [None] * len(node_names)
+
+    def distance(self, src, dest):
+        row = self.rows[src]
+        if row is None:
+            row = self.rows[src] = self.compute_row(src)
+        return row[dest]
+
+    def compute_row(self, src):
+        row = [None] * len(node_names)
+        for v, d in graph.dijkstra(src, self.overlay, 'weight').items():
+            row[v] = d
+        return row
+
+# One table per combination of special travel weights, shared by every game in the process
+hop_tables = {}
+
+def hop_table(boat_weight, alley_weight):
+    key = (boat_weight, alley_weight)
+    if key not in hop_tables:
+        hop_tables[key] = HopTable(boat_weight, alley_weight)
+    return hop_tables[key]
+
+
+# Sets of vertices stored as int bitsets, with bit v set for vertex id v
+def bitset(ids):
+    bits = 0
+    for v in ids:
+        bits |= 1 << v
+    return bits
+
+# The vertex ids in a bitset, lowest first
+def bit_ids(bits):
+    ids = []
+    while bits:
+        low = bits & -bits
+        ids.append(low.bit_length() - 1)
+        bits ^= low
+    return ids
+
+# Names of the vertices in a bitset, in vertex id order
+def bitset_names(bits):
+    return [node_names[v] for v in bit_ids(bits)]
+
+crossing_bits = bitset(node_id[name] for name in crossings)
+location_bits = bitset(node_id[name] for name in locations)
+
+# How far investigators reach around themselves: they move up to 2 crossings a turn
+INVESTIGATOR_REACH = 2
+
+# Locations right next to crossing `v` (a vertex id), i.e. where an investigator standing there can search or arrest.
+# These are exactly the free moves on the investigators' channel.
+def locations_around(v):
+    return [node_names[u] for u, w, transport in graph.i_neighbors[v] if w == 0]
+
+# The same as a bitset, worked out the first time it is needed for each crossing and then reused
+locations_around_rows = {}
+
+def locations_around_bits(v):
+    row = locations_around_rows.get(v)
+    if row is None:
+        row = bitset(u for u, w, transport in graph.i_neighbors[v] if w == 0)
+        locations_around_rows[v] = row
+    return row
+
+# Bitset of the vertices within INVESTIGATOR_REACH of vertex id `v` from the investigators' point of view.
+# Their weights never change, so each vertex's set is worked out the first time it is needed and then reused.
+investigator_reach_rows = {}
+
+def investigator_reach(v):
+    row = investigator_reach_rows.get(v)
+    if row is None:
+        row = bitset(graph.bfs(v, INVESTIGATOR_REACH))
+        investigator_reach_rows[v] = row
+    return row
+
+# Bitset of the locations Jack can reach from location id `v` with one move on foot, i.e. through
+# crossings only, without passing any of the crossings in the bitset `blocked` (the investigators).
+def walk_moves(v, blocked=0):
+    moves = 0
+    seen = {v}
+    stack = [v]
+    while stack:
+        u = stack.pop()
+        for w, weight, transport in graph.neighbors[u]:
+            if transport != NORMAL_MOVE or w in seen:
+                continue
+            seen.add(w)
+            if node_kind[w] & LOCATION:
+                moves |= 1 << w
+            elif not blocked >> w & 1:
+                stack.append(w)
+    return moves
+
+# walk_moves() for the investigator layouts asked about lately, keyed by (vertex id, blocked).  The belief
+# tracker and Jack's lookahead ask for the same few layouts over and over during a turn.  The layouts
+# change from turn to turn, so the rows are let go once there are WALK_ROWS_KEPT of them.
+WALK_ROWS_KEPT = 20000
+walk_move_rows = {}
+
+def cached_walk_moves(v, blocked):
+    key = (v, blocked)
+    row = walk_move_rows.get(key)
+    if row is None:
+        if len(walk_move_rows) >= WALK_ROWS_KEPT:
+            walk_move_rows.clear()
+        row = walk_move_rows[key] = walk_moves(v, blocked)
+    return row
+
+# Bitset of the locations one boat or alley trip (`transport`) away from location id `v`
+def special_moves(v, transport):
+    return bitset(w for w, weight, t in graph.neighbors[v] if t == transport)
+
+# The same moves for every location when nobody is in the way.  These never change, so each row is worked
+# out the first time it is needed and then reused.  Keyed by (vertex id, NORMAL_MOVE, BOAT_MOVE or ALLEY_MOVE).
+jack_move_rows = {}
+
+def jack_moves(v, transport=NORMAL_MOVE):
+    key = (v, transport)
+    row = jack_move_rows.get(key)
+    if row is None:
+        row = walk_moves(v) if transport == NORMAL_MOVE else special_moves(v, transport)
+        jack_move_rows[key] = row
+    return row
+
+
+# Per-query weight adjustments layered over the base edge weights.
+# Jack builds a fresh overlay for every path query instead of editing the shared graph and undoing the edits
+# afterwards, so a query costs a single search and nothing can be left behind if it fails part way through.
+# Layers are keyed by vertex id so the array backend can use them directly.
+class WeightOverlay:
+    def __init__(self, safety_adjust=None):
+        # vertex id -> extra safety weight for entering it (the base "how safe is this location" penalty)
+        self.safety_adjust = safety_adjust if safety_adjust is not None else no_safety_adjust
+        # transport type -> weight for every boat or alley edge (card availability)
+        self.travel_weight = {}
+        # vertex id -> weight added to both channels for every edge entering it (investigator poison)
+        self.poison = {}
+        # vertex id -> weight added to the safety channel for every edge entering it (deterrent halo)
+        self.deterrent = {}
+        # (u, v) vertex ids of edges that cost POISON for this query (e.g. an alley leading onto the target)
+        self.blocked = set()
+        # Combined per-vertex layers, built on first use by entry_weights()
+        self.entry = {}
+
+    def set_travel_weight(self, transport_type, weight):
+        self.travel_weight[transport_type] = weight
+
+    def poison_location(self, loc, adjust=POISON):
+        v = node_id[loc]
+        self.poison[v] = self.poison.get(v, 0) + adjust
+        self.entry = {}
+
+    def discourage_location(self, loc, adjust):
+        v = node_id[loc]
+        self.deterrent[v] = self.deterrent.get(v, 0) + adjust
+        self.entry = {}
+
+    def block_edge(self, u, v):
+        self.blocked.add((node_id[u], node_id[v]))
+
+    # The weight every layer adds to an edge entering each vertex, as a list indexed by vertex id
+    def entry_weights(self, channel='weight'):
+        if channel not in self.entry:
+            if channel == 'safety_weight':
+                entry = list(self.safety_adjust)
+                for v, adjust in self.deterrent.items():
+                    entry[v] += adjust
+            else:
+                entry = list(no_entry_weights)
+            for v, adjust in self.poison.items():
+                entry[v] += adjust
+            self.entry[channel] = entry
+        return self.entry[channel]
+
+    # Combine the base weight of the edge u -> v (vertex ids) with every layer for the requested channel ('weight' or 'safety_weight')
+    def edge_weight(self, u, v, weight, transport, channel='weight'):
+        if (u, v) in self.blocked:
+            w = POISON
+        else:
+            w = self.travel_weight.get(transport, weight)
+        return w + self.entry_weights(channel)[v]
+
+    # Weight callable in the form networkx expects
+    def weight_function(self, channel='weight'):
+        def weight(u, v, d):
+            return self.edge_weight(node_id[u], node_id[v], d['weight'], d['transport'], channel)
+        return weight
+
+no_safety_adjust = [0] * len(node_names)
+no_entry_weights = [0] * len(node_names)
+
+# `python board.py` compiles the board into BOARD_CACHE ahead of time, e.g. after editing graph_data.py
+if __name__ == "__main__":
+    compiled = CsrGraph(edge_list)
+    save_board_cache(compiled)
+    print("Compiled %d vertices and %d edges into %s" % (len(node_names), len(compiled.targets), BOARD_CACHE))
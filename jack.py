@@ -22,8 +22,14 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 '''
 
-import networkx as nx
 from graph_data import *
+import board
+from board import POISON, WeightOverlay
+from paths import CsrPaths, NxPaths
+from lookahead import Lookahead
+import hashlib
+import json
+import os
 import random
 
 # How many extra turns should Jack leave as "buffer" for completing his path
@@ -32,16 +38,44 @@ DEFAULT_WATER_WEIGHT = 1  # Experimental: Using safety weights, treat water like
 DEFAULT_ALLEY_WEIGHT = 13
 DETERRENT_WEIGHTS = [6, 3, 1, 0]
 
+# When Jack considers a coach (see consider_coach_move): the investigators' average distance from him
+# that is too close, the same for when he is heading for his last target, and how close counts as "very close"
+COACH_AVERAGE_DISTANCE = 0.5
+COACH_LAST_TARGET_AVERAGE_DISTANCE = 1.5
+COACH_VERY_CLOSE_DISTANCE = 1
+
+# Milliseconds Jack may spend playing out his options before each move (see lookahead.py), 0 for none,
+# and the most rollouts he plays for each option.  Games are only repeatable from their seed when the
+# rollout limit is reached before the time is up.
+LOOKAHEAD_MS = 0
+LOOKAHEAD_ROLLOUTS = 100
+
+# Jack's tuning knobs.  Jack() takes a dict with any of these keys to override them (see tournament.py).
+DEFAULT_SETTINGS = {
+    "turn_buffer": TURN_BUFFER,
+    "water_weight": DEFAULT_WATER_WEIGHT,
+    "alley_weight": DEFAULT_ALLEY_WEIGHT,
+    "deterrent_weights": DETERRENT_WEIGHTS,
+    "coach_average_distance": COACH_AVERAGE_DISTANCE,
+    "coach_last_target_average_distance": COACH_LAST_TARGET_AVERAGE_DISTANCE,
+    "coach_very_close_distance": COACH_VERY_CLOSE_DISTANCE,
+    "lookahead_ms": LOOKAHEAD_MS,
+    "lookahead_rollouts": LOOKAHEAD_ROLLOUTS,
+}
+
 # This difficulty rating is from JACK's point of view, not the players'
 EASY_BUCKET = 0
 HARD_BUCKET = 1
 
-POISON = 1000
-
 TEXT_MSG=0
 IMG_REFRESH=1
 SPECIAL_TRAVEL_MSG=2
 NEW_ROUND_MSG=3
+BOARD_DELTA_MSG=4   # sent by session.GameSession in place of IMG_REFRESH, with what changed on the board
+
+# Who won the game (Jack.win), once it is over
+JACK_WINS = "jack"
+INVESTIGATORS_WIN = "investigators"
 
 JACK_MOVE_COLOR = "#e6988f"
 WATER_COLOR = "#5eb2fb"
@@ -57,7 +91,7 @@ def reset_graph_color_and_shape(ug, scale=1):
     for node in ug.nodes():
         ug.nodes[node]['color'] = "#000000"
     
-        if 'c' in node:
+        if node in board.crossings:
             ug.nodes[node]['shape'] = "square"
             ug.nodes[node]['size'] = 12*scale
             ug.nodes[node]['fsize'] = 0*scale   # Don't want crossing labels
@@ -80,14 +114,59 @@ def reset_graph_color_and_shape(ug, scale=1):
     for num in water:
         ug.nodes[num]['color'] = WATER_COLOR
 
+# Jack's safety ratings of the board (see Jack.__init__)
+shared_ratings = {}
+
+# The ratings only depend on the map, so they are also saved to this file and loaded by later runs.
+# The file records the RATINGS_VERSION and a hash of the map data it was worked out from, and is
+# ignored when either no longer matches.  Bump RATINGS_VERSION when the way the ratings are worked out changes.
+RATINGS_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ratings_cache.json")
+RATINGS_VERSION = 1
+
+def map_hash():
+    return hashlib.sha256(repr((edge_list, quads, water)).encode()).hexdigest()
+
+# The saved ratings, or None if there are none for the current map
+def load_ratings(filename=RATINGS_CACHE):
+    try:
+        with open(filename) as f:
+            ratings = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if ratings.get("version") != RATINGS_VERSION or ratings.get("map") != map_hash():
+        return None
+    return ratings
+
+def save_ratings(node_safety, max_safety, rated_quads, filename=RATINGS_CACHE):
+    ratings = {"version": RATINGS_VERSION, "map": map_hash(),
+               "node_safety": node_safety, "max_safety": max_safety, "rated_quads": rated_quads}
+    board.atomic_write(filename, json.dumps(ratings).encode())
+
 class Jack:
-    def __init__(self, g, ipos):
-        self.file = open('whitehall.log', 'w')
+    # `backend` selects the path finding implementation: "csr" for the array based board (the default),
+    # or "networkx" to run every query on the DiGraph `g` for debugging.  Jack never modifies `g`, and
+    # with the "csr" backend it is not needed at all (None is fine).
+    # Everything Jack prints and thinks is also logged to `log_file`, unless it is None.
+    # `settings` overrides any of DEFAULT_SETTINGS.
+    # Every random choice Jack makes comes from `rng` (a random.Random), which reset() seeds for each game.
+    def __init__(self, g, ipos, backend="csr", log_file='whitehall.log', settings=None, rng=None):
+        for key in (settings or {}):
+            if key not in DEFAULT_SETTINGS:
+                raise ValueError("Unknown setting for Jack: %s" % key)
+        self.settings = dict(DEFAULT_SETTINGS, **(settings or {}))
+        self.file = open(log_file, 'w') if log_file is not None else None
+        self.rng = rng if rng is not None else random.Random()
+        self.seed = None
         self.graph = g
+        if backend == "networkx":
+            self.paths = NxPaths(g)
+        else:
+            self.paths = CsrPaths()
         self.ipos = ipos
         self.godmode = False
         self.win = None
         self.pos = 0
+        self.active_target = None
         self.it_is_jacks_turn = False
         self.game_in_progress = False
         
@@ -95,6 +174,7 @@ class Jack:
         self.completed_targets = []
         self.crimes = []
         self.clues = []
+        self.searched = []   # locations searched without finding a clue this round
         self.output_func = None
         
         # For bookkeeping these get populated with the turn number they are used
@@ -104,29 +184,33 @@ class Jack:
         
         self.path_used = []
         
-        # Rate all the potential target locations
-        self.rate_nodes()
-        self.rate_quads()
-        
-        # Experimental - use weighted paths based on how "safe" the location is
-        self.weight_for_safety()
-        
-        # Create a set of weights only used for the point of view of the investigators, 
-        # so it omits alley and boat paths and it only weights entering crossings
-        
-        for u, v in self.graph.edges():
-            self.graph.edges[u, v]['i_weight'] = self.graph.edges[u, v]['weight']
-            
-        for u, v in self.graph.edges():
-            if self.graph.edges[u, v]['transport'] == NORMAL_MOVE:
-                source = u
-                target = v
-                if "c" in source and "c" not in target:
-                    self.graph.edges[u, v]['i_weight'] = 0
-                else:
-                    self.graph.edges[u, v]['i_weight'] = 1
+        # Rate all the potential target locations.
+        # The ratings only depend on the board, so the first Jack loads them from RATINGS_CACHE (or works
+        # them out and saves them there) and later ones (e.g. other game sessions in this process) share them.
+        # None of them are changed during a game.
+        if not shared_ratings:
+            ratings = load_ratings()
+            if ratings is not None:
+                self.node_safety = ratings["node_safety"]
+                self.max_safety = ratings["max_safety"]
+                self.rated_quads = ratings["rated_quads"]
             else:
-                self.graph.edges[u, v]['i_weight'] = POISON    # Don't use Jack's special paths (boats and alleys)
+                self.rate_nodes()
+                self.rate_quads()
+                save_ratings(self.node_safety, self.max_safety, self.rated_quads)
+            
+            # Experimental - use weighted paths based on how "safe" the location is
+            self.weight_for_safety()
+            shared_ratings.update(node_safety=self.node_safety, max_safety=self.max_safety,
+                                  rated_quads=self.rated_quads, safety_adjust=self.safety_adjust)
+        else:
+            self.node_safety = shared_ratings['node_safety']
+            self.max_safety = shared_ratings['max_safety']
+            self.rated_quads = shared_ratings['rated_quads']
+            self.safety_adjust = shared_ratings['safety_adjust']
+        
+        # The investigators' point of view (no alleys or boats, only entering crossings costs a move)
+        # is the board's 'i_weight' channel.  See board.CsrGraph.
             
     def node_safety_weight(self, loc):
         weight_adjust = 0
@@ -138,20 +222,37 @@ class Jack:
     def rate_nodes(self):
         self.node_safety = {}
         self.max_safety = 0 
+        # Rate against the unmodified map weights
+        overlay = WeightOverlay()
         for loc, (x, y) in positions:
-            if 'c' not in loc:
-                self.node_safety[loc] = self.location_safety_rating(loc)
+            if loc in board.locations:
+                self.node_safety[loc] = self.location_safety_rating(loc, overlay)
                 if self.node_safety[loc] > self.max_safety:
                     self.max_safety = self.node_safety[loc]
 
+    # The safety penalty for entering each location.  This is the base layer of every overlay's 'safety_weight' channel.
     def weight_for_safety(self):
-        self.set_travel_weight(BOAT_MOVE, DEFAULT_WATER_WEIGHT)
-        self.set_travel_weight(ALLEY_MOVE, DEFAULT_ALLEY_WEIGHT)
-        
-        for u, v in self.graph.edges():
-            weight_adjust = self.node_safety_weight(v)
-            self.graph.edges[u, v]['safety_weight'] =  weight_adjust + self.graph.edges[u, v]['weight']
-            #print ("weighting", u, v, self.graph.edges[u, v]['safety_weight'], " was:", self.graph.edges[u, v]['weight'])
+        self.safety_adjust = tuple(self.node_safety_weight(loc) for loc in board.node_names)
+
+    # Start a fresh set of weight layers for a path query.
+    # The boat and alley paths are weighted according to the cards Jack has left.
+    def new_overlay(self):
+        overlay = WeightOverlay(self.safety_adjust)
+        if len(self.boat_cards) < 2:
+            overlay.set_travel_weight(BOAT_MOVE, self.settings["water_weight"])
+        else:
+            overlay.set_travel_weight(BOAT_MOVE, POISON)
+        if len(self.alley_cards) < 2:
+            overlay.set_travel_weight(ALLEY_MOVE, self.settings["alley_weight"])
+        else:
+            overlay.set_travel_weight(ALLEY_MOVE, POISON)
+        return overlay
+
+    # Weighted distance between two vertices under the given overlay
+    def path_length(self, src, dest, overlay=None, channel='safety_weight'):
+        if overlay is None:
+            overlay = self.new_overlay()
+        return self.paths.distance(src, dest, overlay, channel)
 
     
     def rate_quads(self):
@@ -196,7 +297,8 @@ class Jack:
         self.output_func = func
         
     def log_to_file(self, *msg):
-        print(*msg, file=self.file, flush=True)
+        if self.file is not None:
+            print(*msg, file=self.file, flush=True)
         
     def print(self, *msg):
         if (self.output_func == None):
@@ -227,25 +329,31 @@ class Jack:
     def pick_the_targets(self, difficulty):
         # Choose the 4 targets for the game
         for q in self.rated_quads:
-            self.targets.append(random.choice(q[difficulty]))
+            self.targets.append(self.rng.choice(q[difficulty]))
+
+    # Start a new game.  The same `seed` replays the same game (given the same investigator moves).
+    # Without one, a seed is drawn from the random module, so seeding that makes the games repeatable too.
+    def reset(self, seed=None):
+        if seed is None:
+            seed = random.getrandbits(32)
+        self.seed = seed
+        self.rng.seed(seed)
+        self.godmode_print("Game seed: ", seed)
 
-    def reset(self):
         self.it_is_jacks_turn = False
         self.game_in_progress = True
+        self.win = None
         self.targets = []
         self.crimes = []
         self.clues = []
+        self.searched = []
         self.path_used = []
-        reset_graph_color_and_shape(self.graph)
         
         # Jack gets two of each - track use by length of the array as the array will hold the turn the card was used.
         self.boat_cards = []
         self.alley_cards = []
         self.coach_cards = []
         
-        self.set_travel_weight(BOAT_MOVE, DEFAULT_WATER_WEIGHT)
-        self.set_travel_weight(ALLEY_MOVE, DEFAULT_ALLEY_WEIGHT)
-        
         self.pick_the_targets(EASY_BUCKET)
         
         self.godmode_print("Jack shall visit ", self.targets)
@@ -261,20 +369,47 @@ class Jack:
         # Perform Jack's first move of the game
         self.move()
 
-    
+    # Everything about the game in progress, as plain lists and strings that are cheap to copy or
+    # send to another process.  restore() puts it back, into this or another Jack.
+    def snapshot(self):
+        return {
+            "pos": self.pos,
+            "ipos": list(self.ipos),
+            "active_target": self.active_target,
+            "targets": list(self.targets),
+            "crimes": list(self.crimes),
+            "clues": list(self.clues),
+            "searched": list(self.searched),
+            "path_used": list(self.path_used),
+            "boat_cards": list(self.boat_cards),
+            "alley_cards": list(self.alley_cards),
+            "coach_cards": list(self.coach_cards),
+            "game_in_progress": self.game_in_progress,
+            "win": self.win,
+            "seed": self.seed,
+        }
+
+    def restore(self, state):
+        for key, value in state.items():
+            setattr(self, key, list(value) if isinstance(value, list) else value)
+        self.it_is_jacks_turn = False
+
+
     # Calculate the number of vertices away from the target - every vertex should have a weight of 1
+    # The distances come from the precomputed board tables, so this is a lookup rather than a graph search.
     def hop_count(self, src, dest, boats_reduced=True):
         #unweight the water paths if Jack still has a boat card
-        if (boats_reduced) and (len(self.boat_cards) < 2):
-            self.set_travel_weight(BOAT_MOVE, 1)
-        
-        shortest = nx.shortest_path_length(self.graph, source=src, target=dest, weight='weight')
+        if len(self.boat_cards) < 2:
+            boat_weight = 1 if boats_reduced else self.settings["water_weight"]
+        else:
+            boat_weight = POISON
 
-        #re-weight the water paths if Jack still has a boat card
-        if (boats_reduced) and (len(self.boat_cards) < 2):
-            self.set_travel_weight(BOAT_MOVE, DEFAULT_WATER_WEIGHT)
-        
-        return shortest
+        if len(self.alley_cards) < 2:
+            alley_weight = self.settings["alley_weight"]
+        else:
+            alley_weight = POISON
+
+        return board.hop_table(boat_weight, alley_weight).distance(board.node_id[src], board.node_id[dest])
 
     # choose the optimal target based on current location and investigator positions
     def choose_closest_target(self):
@@ -296,7 +431,7 @@ class Jack:
 
 
     def choose_starting_target(self):
-        self.active_target = random.choice(self.targets)
+        self.active_target = self.rng.choice(self.targets)
         return
         
         # Built a list of targets that aren't aren't too close to the investigators
@@ -335,7 +470,7 @@ class Jack:
 
         # If we have targets that are not too close, pick one randomly
         if len(candidates) > 0:
-            self.active_target = random.choice(candidates)
+            self.active_target = self.rng.choice(candidates)
         else:
             self.godmode_print("All the targets are close to an investigator. Choosing the farthest of all 4...")
             self.active_target = farthest_target
@@ -347,20 +482,17 @@ class Jack:
         self.make_image()
 
     def find_next_location(self, vlist):
-        index = 1
-        while 'c' in vlist[index]:
-            index=index+1
-        return vlist[index]
+        return board.next_location(vlist)
 
     # Find the second vertex in the vlist
     def find_second_location(self, vlist):
         index = 1
-        while 'c' in vlist[index]:
+        while vlist[index] in board.crossings:
             index=index+1
         index = index+1   # Skip over the first vertex
         
         if index < len(vlist):
-            while 'c' in vlist[index]:
+            while vlist[index] in board.crossings:
                 index=index+1
             ret = vlist[index]
         else:
@@ -370,66 +502,70 @@ class Jack:
                 choices.remove(self.active_target)
             if vlist[0] in choices:
                 choices.remove(vlist[0])
-            ret = random.choice(choices)
+            ret = self.rng.choice(choices)
             
         return ret
 
-    def poison_location(self, loc, adjust):
+    def poison_location(self, overlay, loc, adjust=POISON):
         self.godmode_print("Poisoning: ", loc, adjust)
-        for u, v in self.graph.in_edges(loc):
-            self.graph.edges[u,v]['safety_weight'] += adjust
-            self.graph.edges[u,v]['weight'] += adjust
+        overlay.poison_location(loc, adjust)
             
     # Poison all the paths (i.e. edges) that go through an inspector (i.e. ipos) as Jack isn't allowed to use those
-    # NOTE: This assumes this called alternatively with a positive then a negative value
-    #       It saves the list of poisoned locations, then the next call uses that list for the unpoisoning
-    def poison_investigators(self, adjust):
-        if not hasattr(self, "is_poison"):
-            self.is_poison = []
-
-        if len(self.is_poison) == 0:
-            for num in range (0, 3):
-                # Only poison if the investigator crossing can be reached by Jack in less than 3 moves
-                if self.hop_count(self.ipos[num], self.pos) <= 2:
-                    self.is_poison.append(num)
-                    self.godmode_print("Investigator #", num, "is poison.")
-                    self.poison_location(self.ipos[num], adjust)
-                    
-            self.godmode_print("Poisoned investigators...", self.is_poison, adjust)
-        else:
-            self.godmode_print("Unpoisoning investigators...", self.is_poison, adjust)
-            for num in self.is_poison:
-                self.poison_location(self.ipos[num], adjust)
-            self.is_poison = [] # Discard the entries so next time this is called, we start over
+    # The poison only lives in the supplied overlay, so there is nothing to undo afterwards.
+    def poison_investigators(self, overlay, poisoned=None):
+        if poisoned is None:
+            poisoned = self.poisoned_investigators()
+        for loc in poisoned:
+            self.poison_location(overlay, loc)
+
+    # The investigator crossings Jack has to steer around this turn
+    def poisoned_investigators(self):
+        is_poison = []
+        for num in range (0, 3):
+            # Only poison if the investigator crossing can be reached by Jack in less than 3 moves
+            if self.hop_count(self.ipos[num], self.pos) <= 2:
+                is_poison.append(num)
+                self.godmode_print("Investigator #", num, "is poison.")
+                
+        self.godmode_print("Poisoned investigators...", is_poison)
+        return [self.ipos[num] for num in is_poison]
 
     def investigator_distance(self, num):
         # Find the vertex belonging to the `num` ivestigator
         v = self.ipos[num]
-        distance = nx.shortest_path_length(self.graph, source=v, target=self.pos, weight='i_weight')
+        distance = self.paths.distance(v, self.pos, None, 'i_weight')
         return distance
     
     # returns a list of crossings <= 2 spaces away
     def investigator_crossing_options(self, num):
-        v = self.ipos[num]
-        shortest_paths = nx.single_source_dijkstra_path_length(self.graph, v, cutoff=2, weight='i_weight')
-        # List nodes within the maximum weighted distance
-        return [node for node in shortest_paths.keys() if 'c' in node]
+        v = board.node_id[self.ipos[num]]
+        return board.bitset_names(board.investigator_reach(v) & board.crossing_bits)
     
-    # Discourage Jack from taking paths near investigators by increasing the weights
-    def discourage_investigators2(self, adjust):
+    # Discourage Jack from taking paths near investigators by increasing the weights in the overlay.
+    # `halo` is what investigator_halo() returns, if it has already been worked out for this turn.
+    def discourage_investigators2(self, overlay, adjust, halo=None):
+        # A zero deterrent would not change any weights
+        if adjust == 0:
+            return
+        if halo is None:
+            halo = self.investigator_halo()
+        for loc, count in halo.items():
+            overlay.discourage_location(loc, adjust * count)
+
+    # The locations within 2 spaces of each investigator who is close to Jack, with the number of
+    # investigators each one is near.  The deterrent is added once per investigator.
+    def investigator_halo(self):
+        halo = {}
         for num in range (0, 3):
             distance = self.investigator_distance(num)
-            if (adjust > 0):
-                self.godmode_print("Investigator#", num, "at", self.ipos[num], "is", distance, "away.")
+            self.godmode_print("Investigator#", num, "at", self.ipos[num], "is", distance, "away.")
             if distance <= 4:
-                v = self.ipos[num]
-                # Follow paths up to 2 spaces away (from the investigator's point of view)
-                shortest_paths = nx.single_source_dijkstra_path_length(self.graph, v, cutoff=2, weight='i_weight')
-                for v in shortest_paths.keys():
-                    # Only discourage edges directly connected to a location.  Otherwise adjacent crossings poison a path too much.  Jack doesn't care about how many crossings he crosses.
-                    if "c" not in v:
-                        for u, v in self.graph.in_edges(v):
-                            self.graph.edges[u,v]['safety_weight'] += adjust
+                # Everything up to 2 spaces away (from the investigator's point of view).
+                # Only discourage edges directly connected to a location.  Otherwise adjacent crossings poison a path too much.  Jack doesn't care about how many crossings he crosses.
+                reach = board.investigator_reach(board.node_id[self.ipos[num]])
+                for loc in board.bitset_names(reach & board.location_bits):
+                    halo[loc] = halo.get(loc, 0) + 1
+        return halo
     
     def status(self):
         self.print()
@@ -445,13 +581,6 @@ class Jack:
         #print
         
 
-    def set_travel_weight(self, transport_type, weight):
-        #self.godmode_print("set_travel_weight:", transport_type, weight)
-        for u, v in self.graph.out_edges():
-            if self.graph.edges[u, v]['transport'] == transport_type:
-                self.graph.edges[u, v]['weight'] = weight
-                self.graph.edges[u, v]['safety_weight'] = weight + self.node_safety_weight(v)
-    
     # If Jack is running out of moves,
     # then reduce the weights of alley moves if he still has alley cards
     def consider_desperate_weights(self, enabled):
@@ -461,32 +590,38 @@ class Jack:
         return len(self.path_used)
         
 
-    def free_edge_count(self, pos):
+    def free_edge_count(self, pos, overlay=None):
+        if overlay is None:
+            overlay = self.new_overlay()
         #calculate the out-degree but don't count boat or alley paths or poisoned paths
         out_degree = 0
-        for u, v in self.graph.out_edges(pos):
-            if (self.graph.edges[u, v]['transport'] == NORMAL_MOVE) and (self.graph.edges[u, v]['weight'] < POISON):
+        g = board.graph
+        u = board.node_id[pos]
+        for e in g.out_edges(u):
+            if (g.transport[e] == NORMAL_MOVE) and (overlay.edge_weight(u, g.targets[e], g.weight[e], g.transport[e]) < POISON):
                 out_degree += 1
         return out_degree
     
     # Compute the safety rating of a location - HIGHER is SAFER
-    def location_safety_rating(self, pos):
-        one_away = len(self.locations_one_away(pos))
-        out_degree = self.free_edge_count(pos)
+    def location_safety_rating(self, pos, overlay=None):
+        one_away = len(self.locations_one_away(pos, overlay))
+        out_degree = self.free_edge_count(pos, overlay)
         return one_away * out_degree
 
     # Return the LOCATIONS (not crossings) exactly 1 space away from `source` assuming Jack's movement
-    def locations_one_away(self, source):
-        shortest_paths = nx.single_source_dijkstra_path_length(self.graph, source, cutoff=1, weight='weight')
+    def locations_one_away(self, source, overlay=None):
+        if overlay is None:
+            overlay = self.new_overlay()
+        shortest_paths = self.paths.lengths_within(source, 1, overlay, 'weight')
         # List nodes within the maximum weighted distance
-        locs = [node for node in shortest_paths.keys() if 'c' not in node]
+        locs = [node for node in shortest_paths.keys() if node in board.locations]
         locs.remove(source)
         return locs
     
-    def find_adjacent_nongoal_vertex(self):
+    def find_adjacent_nongoal_vertex(self, overlay=None):
         # Jack is not allowed to move to a target destination using a coach
         # Pick another vertex that is 1 space away and isn't where he was previously, since that is also against the rules
-        vertices_with_distance_one = self.locations_one_away(self.active_target)
+        vertices_with_distance_one = self.locations_one_away(self.active_target, overlay)
 
         self.godmode_print("   removing:", self.pos)
         if self.pos in vertices_with_distance_one:
@@ -494,7 +629,7 @@ class Jack:
         self.godmode_print("These are all 1 away from ", self.active_target)
         self.godmode_print(vertices_with_distance_one)
         if (len(vertices_with_distance_one) > 0):
-            choice = random.choice(vertices_with_distance_one)
+            choice = self.rng.choice(vertices_with_distance_one)
             self.godmode_print("Choosing:", choice)
         else:
             choice = None
@@ -520,7 +655,7 @@ class Jack:
             
             num_very_close = 0
             for num in dist:
-                if num <= 1:
+                if num <= self.settings["coach_very_close_distance"]:
                     num_very_close += 1
             self.godmode_print(num_very_close, "are very close.")
             
@@ -528,9 +663,9 @@ class Jack:
             on_clue = len(self.clues) > 0 and (self.pos == self.clues[-1])
             
             # How many outbound edges are not blocked by investigators?
-            self.poison_investigators(POISON)
-            free_edge_count = self.free_edge_count(self.pos)
-            self.poison_investigators(-POISON)
+            overlay = self.new_overlay()
+            self.poison_investigators(overlay)
+            free_edge_count = self.free_edge_count(self.pos, overlay)
             
             # If the investigator crossing is adjacent to Jack, or all the investigators on average are close, 
             # or Jack is searching for the final target on his list and the investigators are somewhat close,
@@ -538,124 +673,110 @@ class Jack:
             # TODO - add some random variability to the threshold?  
             #        or maybe if the number of clues found is over X _and_ the average is < Y
             #        or maybe if the running average is < X over Y turns?
-            if ((closest < 1 and on_clue) or average < 0.5) or (len(self.targets) == 1 and average < 1.5) or (num_very_close >= 2 and free_edge_count < num_very_close):
+            settings = self.settings
+            if (((closest < 1 and on_clue) or average < settings["coach_average_distance"])
+                    or (len(self.targets) == 1 and average < settings["coach_last_target_average_distance"])
+                    or (num_very_close >= 2 and free_edge_count < num_very_close)):
                 ret = True
         return ret
 
-    def random_shortest_path(self, source, target):
-        # Generate all shortest paths between the source and target
-        shortest_paths = list(nx.all_shortest_paths(self.graph, source, target, weight='safety_weight'))
-
-        if not shortest_paths:
-            return None
-
-        # Choose a random shortest path
-        random_path = random.choice(shortest_paths)
-
-        return random_path
+    def random_shortest_path(self, source, target, overlay=None):
+        if overlay is None:
+            overlay = self.new_overlay()
+        # Draw one of the shortest paths between the source and target, each equally likely.
+        # There can be thousands of them across the board, so they are counted rather than listed.
+        return self.paths.random_shortest_path(source, target, overlay, 'safety_weight', self.rng)
 
     
     # Choose the path when Jack has decided he needs to use a coach
     def pick_a_coach_path(self):
-        # compute shortest path without any poisoned paths since Jack can move through investigators using a coach
-        # but... Jack cannot take a boat at the same time, so poison the water routes
-        
-        self.set_travel_weight(BOAT_MOVE, POISON)
-        self.set_travel_weight(ALLEY_MOVE, POISON)
-        
         # decide on a path
-        deterrents = DETERRENT_WEIGHTS
+        halo = self.investigator_halo()
+        deterrents = self.settings["deterrent_weights"]
         for deterrent in deterrents:
+            # compute shortest path without any poisoned paths since Jack can move through investigators using a coach
+            # but... Jack cannot take a boat at the same time, so poison the water routes
+            overlay = self.new_overlay()
+            overlay.set_travel_weight(BOAT_MOVE, POISON)
+            overlay.set_travel_weight(ALLEY_MOVE, POISON)
+
             v1 = self.pos
             
             # Can't go to the active_target, so pick a random location 1 away from it
             # and poison the active_target so Jack does not travel through it. 
             # (It's not 100% clear in the rules if he could not travel through it as the 
             # intermediate move, but I'll not allow it to be safe.)
-            v2 = self.find_adjacent_nongoal_vertex()
-            self.poison_location(self.active_target, POISON)
+            v2 = self.find_adjacent_nongoal_vertex(overlay)
+            self.poison_location(overlay, self.active_target)
 
-            self.discourage_investigators2(deterrent)
-            vlist = self.random_shortest_path(v1, v2)
-            self.discourage_investigators2(-deterrent)
-            self.poison_location(self.active_target, -POISON)
+            self.discourage_investigators2(overlay, deterrent, halo)
+            vlist = self.random_shortest_path(v1, v2, overlay)
             
             # Compute the cost of this chosen path.  Easiest to just count the entries that aren't crossing
-            cost = sum(1 for entry in vlist if 'c' not in entry) - 1
+            cost = board.location_count(vlist) - 1
             self.godmode_print("   Considering coach cost: ", cost)
                             
             if (cost <= (16 - self.turn_count())):
                 self.godmode_print("   Jack finds this coach cost acceptable.")
                 break;
         
-        # Restore the weights if Jack still has cards for the move type
-        if (len(self.boat_cards) < 2):
-            self.set_travel_weight(BOAT_MOVE, DEFAULT_WATER_WEIGHT)
-        if (len(self.alley_cards) < 2):
-            self.set_travel_weight(ALLEY_MOVE, DEFAULT_ALLEY_WEIGHT)
         return vlist
 
     def normal_move_possible(self, src, dest):
         ret = False
-        self.poison_investigators(POISON)
-        self.set_travel_weight(BOAT_MOVE, POISON)
-        self.set_travel_weight(ALLEY_MOVE, POISON)
+        overlay = self.new_overlay()
+        self.poison_investigators(overlay)
+        overlay.set_travel_weight(BOAT_MOVE, POISON)
+        overlay.set_travel_weight(ALLEY_MOVE, POISON)
         
         v1 = src
         v2 = dest
-        path_weight = nx.shortest_path_length(self.graph, source=v1, target=v2, weight='safety_weight')
+        path_weight = self.path_length(v1, v2, overlay)
         self.godmode_print("      Alley thoughts: count to get to ", dest, "is", path_weight)
         if (path_weight == 1):
             ret = True
 
-        self.poison_investigators(-POISON)            
-        # Restore the weights if Jack still has cards for the move type
-        if (len(self.boat_cards) < 2):
-            self.set_travel_weight(BOAT_MOVE, DEFAULT_WATER_WEIGHT)
-        if (len(self.alley_cards) < 2):
-            self.set_travel_weight(ALLEY_MOVE, DEFAULT_ALLEY_WEIGHT)
-        
         return ret
         
-    def pick_a_path_helper(self, deterrent):
+    # Something is badly wrong with the weights: show them all and bail out
+    def dump_weights(self, overlay):
+        print("Noooo!")
+        g = board.graph
+        for u in range(len(board.node_names)):
+            for e in g.out_edges(u):
+                v = g.targets[e]
+                print(board.node_names[u], board.node_names[v], overlay.edge_weight(u, v, g.weight[e], g.transport[e], 'safety_weight'))
+        exit(0)
+
+    def pick_a_path_helper(self, sweep, deterrent, blocked=()):
         move_type = NORMAL_MOVE
 
-        # Poison the position of the investigators (i.e. add weights)
+        # Poison the position of the investigators and discourage the spaces around them (i.e. add weights)
         # TODO: if getting close to the end of the round and still have coach cards, maybe don't poison inspector paths and if one is chosen, use a coach?
-        self.poison_investigators(POISON)
-        self.discourage_investigators2(deterrent)
+        overlay = sweep.overlay(deterrent, blocked)
 
         v1 = self.pos
         
-        # Consider all the targets and return the easiest to reach
-        shortest_path = 1000000
+        # Consider all the targets and head for the easiest to reach.
+        # One search from Jack's position gives the distances to every target and a path to the closest.
+        try:
+            plan = sweep.plan(deterrent, blocked)
+        except ValueError as e:
+            self.dump_weights(overlay)
         for target in self.targets:
-            v2 = target
-            try:
-                path_weight = nx.shortest_path_length(self.graph, source=v1, target=v2, weight='safety_weight')
-            except ValueError as e:
-                print("Noooo!")
-                for u, v in self.graph.edges():
-                    print(u, v, self.graph.edges[u, v]['safety_weight'])
-                exit(0)
+            path_weight = plan.target_dist[target]
             self.godmode_print("   Weight to get to ", target, " is ", path_weight)
             if path_weight < 0:
-                print("Noooo!")
-                for u, v in self.graph.edges():
-                    print(u, v, self.graph.edges[u, v]['safety_weight'])
-                exit(0)
-            if (path_weight < shortest_path):
-                self.active_target = target
-                shortest_path = path_weight
-        
-        v2 = self.active_target
-        vlist = self.random_shortest_path(v1, v2)
+                self.dump_weights(overlay)
+        
+        self.active_target = plan.target
+        vlist = plan.path
         self.godmode_print("Considering: ", [v for v in vlist])
         
         # Detect when surrounded (i.e shortest path to the next vertex is > 1000) and 
         # determine if any move is possible or if Jack is trapped and loses.
-        next_loc = self.find_next_location(vlist)
-        next_dist = nx.shortest_path_length(self.graph, source=v1, target=next_loc, weight='safety_weight')
+        next_loc = plan.next_location
+        next_dist = plan.next_dist
         self.godmode_print("   Next dist is:", next_dist)
         if next_dist >= POISON:
             # If getting to the next location goes through a blocked path, 
@@ -670,18 +791,27 @@ class Jack:
                     self.print("Jack cannot move.  You win!")
                     self.print("Jack's current position: ", self.pos)
                     self.game_in_progress = False
+                    self.win = INVESTIGATORS_WIN
             else:
                 try_count = 0
                 while (next_dist >= POISON):
                     self.godmode_print("   Ouch! Goal is blocked!")
                     # Trying to reach goal.  Must pick a different spot as the goal is surrounded.
-                    candidates = locations_one_away(self.pos)
+                    candidates = self.locations_one_away(self.pos, overlay)
                     if self.active_target in candidates:
                         candidates.remove(self.active_target)
-                    new_loc = random.choice(candidates)
+
+                    # Nowhere else to go either
+                    if not candidates:
+                        self.print("Jack cannot move.  You win!")
+                        self.print("Jack's current position: ", self.pos)
+                        self.game_in_progress = False
+                        self.win = INVESTIGATORS_WIN
+                        break;
+                    new_loc = self.rng.choice(candidates)
                     self.godmode_print(f"    Let's visit {new_loc} instead.")
-                    vlist = self.random_shortest_path(v1, new_loc)
-                    next_dist = nx.shortest_path_length(self.graph, source=v1, target=new_loc, weight='safety_weight')
+                    vlist = self.random_shortest_path(v1, new_loc, overlay)
+                    next_dist = self.path_length(v1, new_loc, overlay)
                     self.godmode_print("   Next dist is:", next_dist)
                     try_count += 1
                     
@@ -690,24 +820,21 @@ class Jack:
                         self.print("Jack cannot move.  You win!")
                         self.print("Jack's current position: ", self.pos)
                         self.game_in_progress = False
+                        self.win = INVESTIGATORS_WIN
                         break;
-
-        # un-poison the ipos edges
-        self.poison_investigators(-POISON)
-        self.discourage_investigators2(-deterrent)
     
         # Compute the cost of this chosen path.  Easiest to just count the entries that aren't crossing
-        cost = sum(1 for entry in vlist if 'c' not in entry) - 1
+        cost = board.location_count(vlist) - 1
         self.godmode_print("    Cost: ", cost)
 
         # If we didn't decide we have to take a coach, figure out if it was a boat or alley move, based on the next vertex in the path
         if move_type != COACH_MOVE:
             # Going from a water space to another water space - must be using a boat
-            if ((self.pos in water) and (vlist[1] in water)):
+            if ((self.pos in board.water_locations) and (vlist[1] in board.water_locations)):
                 move_type = BOAT_MOVE
         
             # Jack didn't pass through any crossings - must be using an alley
-            elif 'c' not in vlist[1]:
+            elif vlist[1] in board.locations:
                 # Confirm Jack couldn't have gotten there in 1 turn using a normal move.
                 # If he could, don't waste an alley card
                 if not self.normal_move_possible(self.pos, vlist[1]):
@@ -716,41 +843,29 @@ class Jack:
                     self.godmode_print("Hmmm...   Jack thought to use an alley, but he can just walk there.")
                     self.godmode_print("   Randomly decide.")
                     # Randomly decide to use it so not totally predictable where he went when he uses an alley card.
-                    if random.randint(1, 100) < 18:
+                    if self.rng.randint(1, 100) < 18:
                         move_type = ALLEY_MOVE
     
         return [vlist, cost, move_type]
         
     
-    def pick_a_path(self, deterrent):        
+    def pick_a_path(self, sweep, deterrent):        
         path_ok = False
-        alleys_poison = False
-        alley_dest = []
+        # Alleys Jack has ruled out for this move.  They are only blocked in the overlays built for this move.
+        blocked_alleys = []
         
         # Need to loop in case an alley was chosen for the final target.
         while(not path_ok):
-            vlist, cost, move_type = self.pick_a_path_helper(deterrent)
+            vlist, cost, move_type = self.pick_a_path_helper(sweep, deterrent, blocked_alleys)
             # Check to make sure we are not using an alley to get to the target, as that isn't allow per the rules
             if (move_type == ALLEY_MOVE) and (vlist[1] == self.active_target):
                 self.godmode_print("Oops! Jack tried to use an alley to get to the goal.  That is not allowed.")
                 self.godmode_print("Recalculating...")
                 
                 # Make so Jack won't consider that specific alley
-                self.graph.edges[self.pos, self.active_target]['safety_weight'] = POISON + self.node_safety_weight(self.active_target)
-                self.graph.edges[self.pos, self.active_target]['weight'] = POISON
-                alleys_poison = True
-                # We can potentially get a new target from `pick_a_path_helper()` so we need to save the current poisoned one
-                # for later unpoisoning
-                alley_dest.append(self.active_target)
+                blocked_alleys.append((self.pos, self.active_target))
             else: 
                 path_ok = True
-                if (alleys_poison):
-                    if (len(self.alley_cards) < 2):
-                        for dest in alley_dest:
-                            self.graph.edges[self.pos, dest]['safety_weight'] = DEFAULT_ALLEY_WEIGHT + self.node_safety_weight(self.active_target)
-                            self.graph.edges[self.pos, dest]['weight'] = POISON
-                            self.godmode_print("Unoopsie poisoning", self.graph.edges[self.pos, dest]['safety_weight'])
-                    alleys_poison = False
         
         return [vlist, cost, move_type]
         
@@ -773,6 +888,7 @@ class Jack:
             self.path_used = [self.pos]
             self.targets.remove(self.pos)
             self.clues = []
+            self.searched = []
             if self.output_func != None:
                 self.output_func(NEW_ROUND_MSG, None)
 
@@ -781,6 +897,7 @@ class Jack:
             self.print("    Crime locations: ", self.crimes)
             self.make_image()
             self.game_in_progress = False
+            self.win = JACK_WINS
             return
         
         # Each turn reconsider what is the best target to try
@@ -788,13 +905,14 @@ class Jack:
         # NOTE: pick_a_path() does this now (as an experimental test)
         #self.choose_closest_target()
         
-        # decide on a path
-        deterrents = DETERRENT_WEIGHTS
+        # decide on a path, trying the deterrent levels in turn until one gives an acceptable cost
+        sweep = DeterrentSweep(self)
+        deterrents = self.settings["deterrent_weights"]
         for deterrent in deterrents:
-            vlist, cost, move_type = self.pick_a_path(deterrent)
+            vlist, cost, move_type = self.pick_a_path(sweep, deterrent)
             if not self.game_in_progress:
                 return
-            if (cost <= ((16 - TURN_BUFFER) - self.turn_count())):
+            if (cost <= ((16 - self.settings["turn_buffer"]) - self.turn_count())):
                 self.godmode_print("   Jack finds this cost acceptable.")
                 break;
         
@@ -805,16 +923,29 @@ class Jack:
             if (self.hop_count(self.pos, self.active_target) != 1):
                 if self.consider_coach_move():
                     move_type = COACH_MOVE
+
+        # If we decide we should use a coach, revise the path since we can move through investigators
+        if (move_type == COACH_MOVE):
+            vlist = self.pick_a_coach_path()
+
+        # Optionally play out every allowed move a few turns ahead, and switch if another does better
+        if self.settings["lookahead_ms"] > 0:
+            chosen = [self.find_next_location(vlist)]
+            if move_type == COACH_MOVE:
+                chosen.append(self.find_second_location(vlist))
+            better_type, better = Lookahead(self).choose(move_type, chosen)
+            if (better_type, better) != (move_type, chosen):
+                move_type, chosen = better_type, better
+                vlist = [self.pos] + chosen
+                # He may be heading for a different target now
+                self.active_target = min(self.targets, key=lambda t: self.hop_count(chosen[-1], t))
         
         # If a water path was selected, spend the card
         if move_type == BOAT_MOVE:
             self.print("Jack took a boat on turn %d!" % len(self.path_used))
             self.boat_cards.append(self.turn_count())
             self.notify_gui_of_special_travel(BOAT_MOVE)
-            
-            if (len(self.boat_cards)>= 2):
-                # poison all the water paths - Jack has no boat cards left
-                self.set_travel_weight(BOAT_MOVE, POISON)
+            # Once both boat cards are spent, new_overlay() poisons all the water paths
 
         # If a alley path was selected, spend the card
         elif move_type == ALLEY_MOVE:
@@ -823,13 +954,10 @@ class Jack:
             self.notify_gui_of_special_travel(ALLEY_MOVE)
             
             if (len(self.alley_cards)>= 2):
-                # poison all the alley paths - Jack has no alley cards left
+                # Jack has no alley cards left, so new_overlay() poisons all the alley paths from now on
                 self.godmode_print("Poisoning alleys so they can no longer be used.")
-                self.set_travel_weight(ALLEY_MOVE, POISON)
         
-        # If we decide we should use a coach, revise the path since we can move through investigators
         if (move_type == COACH_MOVE):
-            vlist = self.pick_a_coach_path()
             self.notify_gui_of_special_travel(COACH_MOVE)
             self.godmode_print("\033[1mChoosing this for a coach path:\033[0m")
             self.godmode_print([v for v in vlist])
@@ -869,7 +997,7 @@ class Jack:
     def is_loc_adjacent(self, loc):
         loc_good = False
         for num in range(0,3):
-            if nx.shortest_path_length(self.graph, source=self.ipos[num], target=loc, weight='i_weight') == 0:
+            if loc in board.locations_around(board.node_id[self.ipos[num]]):
                 loc_good = True
                 break;
         if not loc_good:
@@ -877,6 +1005,7 @@ class Jack:
             self.print("Please enter a valid location list.")
         return loc_good
             
+    # Returns the location where a clue was found, or None
     def clue_search(self, pos_list):
         # Set flag to prevent players from moving after they started searching for clues
         self.it_is_jacks_turn = True
@@ -896,17 +1025,20 @@ class Jack:
                 self.print("Clue found at \033[1m", loc, "\033[0m!!")
                 self.clues.append(loc)
                 self.make_image()
-                break
+                return loc
             else:
                 self.print(loc, ": no clue")
+                self.searched.append(loc)
+        return None
 
+    # Returns True if Jack was caught
     def arrest(self, pos):
         # Set flag to prevent players from moving after they performed an arrest
         self.it_is_jacks_turn = True
         
         #verify arrest location is next to an ipos
         if not self.godmode and not self.is_loc_adjacent(pos):
-            return
+            return False
             
         if pos == self.pos:
             self.print("Congratulations!  You \033[1marrested\033[0m Jack at location ", pos, "!")
@@ -914,7 +1046,48 @@ class Jack:
             self.print("His remaining target goals were:")
             self.print(self.targets)
             self.game_in_progress = False
+            self.win = INVESTIGATORS_WIN
+            return True
         else:
             self.print("Jack is not at location ", pos)
+            return False
         
-        
\ No newline at end of file
+        
+
+
+# The weights for every deterrent level Jack considers during one move.
+# Which investigators are poison and which locations lie in the halo around the nearby ones only
+# depends on where everyone stands, so it is worked out once per move.  Each level just scales the
+# halo, and levels that come out with the same weights (e.g. when no investigator is close enough to
+# have a halo) share one search, drawing a fresh random path each time.
+class DeterrentSweep:
+    def __init__(self, jack):
+        self.jack = jack
+        self.poisoned = jack.poisoned_investigators()
+        self.halo = jack.investigator_halo()
+        self.searches = {}
+
+    # Without a halo every deterrent level has the same weights
+    def level(self, deterrent):
+        return deterrent if self.halo else 0
+
+    def overlay(self, deterrent, blocked=()):
+        key = (self.level(deterrent), tuple(blocked))
+        if key not in self.searches:
+            overlay = self.jack.new_overlay()
+            for u, v in blocked:
+                overlay.block_edge(u, v)
+            self.jack.poison_investigators(overlay, self.poisoned)
+            self.jack.discourage_investigators2(overlay, key[0], self.halo)
+            self.searches[key] = [overlay, None]
+        return self.searches[key][0]
+
+    # The plan towards Jack's targets at this deterrent level
+    def plan(self, deterrent, blocked=()):
+        overlay = self.overlay(deterrent, blocked)
+        search = self.searches[(self.level(deterrent), tuple(blocked))]
+        if search[1] is None:
+            search[1] = self.jack.paths.plan(self.jack.pos, self.jack.targets, overlay, 'safety_weight', self.jack.rng)
+        else:
+            search[1].resample()
+        return search[1]
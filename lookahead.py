@@ -0,0 +1,153 @@
+'''
+MIT License
+
+Copyright (c) 2023 Brian Stormont
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+# Jack's optional lookahead (the "lookahead_ms" setting): before committing to the move his path
+# finding came up with, he plays every move he is allowed to make a few turns ahead against sampled
+# investigator responses, and takes the one that most often keeps him free and on schedule for a target.
+#
+# In the rollouts the investigators move up to two crossings each.  Each of them either heads straight
+# for Jack (as if they had guessed where he is) or wanders, and a chasing investigator who ends up next
+# to Jack arrests him.  Jack walks towards his closest target each turn.  A rollout counts as a success
+# if he reaches a target, or is still free after LOOKAHEAD_TURNS turns with as many moves to spare as
+# his "turn_buffer" setting asks for.  When no move manages that, his own choice stands.
+
+import math
+import time
+import random
+
+from graph_data import *
+import board
+from board import POISON
+
+# How many of Jack's turns a rollout plays
+LOOKAHEAD_TURNS = 3
+
+# How likely a sampled investigator is to head straight for Jack
+LOOKAHEAD_CHASE = 0.5
+
+# How much better (in the share of successful rollouts) a move has to do to be picked over one Jack
+# prefers: his own choice first, then walks, boats, alleys and coaches.  Spending a card his own
+# choice would not have spent needs a bigger margin, and with few rollouts the margin grows by
+# 1/sqrt(rollouts) so a lucky streak is not taken for a better move.
+LOOKAHEAD_MARGIN = 0.05
+LOOKAHEAD_CARD_MARGIN = 0.2
+
+class Lookahead:
+    def __init__(self, jack):
+        self.jack = jack
+        self.hops = board.hop_table(POISON, POISON)
+        self.targets = [board.node_id[t] for t in jack.targets]
+        # A generator of its own, so the number of rollouts played does not change Jack's other random choices
+        self.rng = random.Random(jack.rng.getrandbits(32))
+
+    def target_distance(self, v):
+        return min(self.hops.distance(v, t) for t in self.targets)
+
+    # Every move Jack may make now, as (move type, [locations he moves through]) with walks first, then
+    # boats, alleys and coaches.  They follow the card rules in Jack.move(): two of each card, boats only
+    # between water locations, and no alley or coach onto a target (nor a coach through one).
+    def candidates(self):
+        jack = self.jack
+        pos = board.node_id[jack.pos]
+        blocked = board.bitset(board.node_id[p] for p in jack.ipos)
+        targets = board.bitset(self.targets)
+        walks = board.cached_walk_moves(pos, blocked)
+
+        moves = [(NORMAL_MOVE, [v]) for v in board.bit_ids(walks)]
+        if len(jack.boat_cards) < 2:
+            moves += [(BOAT_MOVE, [v]) for v in board.bit_ids(board.jack_moves(pos, BOAT_MOVE))]
+        if len(jack.alley_cards) < 2:
+            moves += [(ALLEY_MOVE, [v]) for v in board.bit_ids(board.jack_moves(pos, ALLEY_MOVE) & ~walks & ~targets)]
+        if len(jack.coach_cards) < 2 and 16 - jack.turn_count() >= 2:
+            for first in board.bit_ids(board.jack_moves(pos) & ~targets):
+                moves += [(COACH_MOVE, [first, second])
+                          for second in board.bit_ids(board.jack_moves(first) & ~targets & ~(1 << pos))]
+        return moves
+
+    # Play one rollout with Jack at `v` having made `turn` moves.  Returns 1 if it went well for him.
+    def rollout(self, v, turn):
+        rng = self.rng
+        buffer = self.jack.settings["turn_buffer"]
+        ipos = [board.node_id[p] for p in self.jack.ipos]
+        for step in range(LOOKAHEAD_TURNS):
+            # The investigators' turn: each one chases or wanders, without ending on another's crossing
+            caught = False
+            for num in range(3):
+                occupied = board.bitset(ipos[:num] + ipos[num+1:])
+                options = board.bit_ids(board.investigator_reach(ipos[num]) & board.crossing_bits & ~occupied)
+                if rng.random() < LOOKAHEAD_CHASE:
+                    best = min(self.hops.distance(c, v) for c in options)
+                    ipos[num] = rng.choice([c for c in options if self.hops.distance(c, v) == best])
+                    caught = caught or bool(board.locations_around_bits(ipos[num]) >> v & 1)
+                else:
+                    ipos[num] = rng.choice(options)
+            if caught:
+                return 0
+            if v in self.targets:
+                return 1
+
+            # Jack's turn: walk towards the closest target
+            options = board.bit_ids(board.cached_walk_moves(v, board.bitset(ipos)))
+            if not options:
+                return 0
+            best = min(self.target_distance(u) for u in options)
+            v = rng.choice([u for u in options if self.target_distance(u) == best])
+            turn += 1
+        return 1 if 16 - turn - self.target_distance(v) >= buffer else 0
+
+    # Pick Jack's move, given the one his path finding chose (its type and the locations he would move
+    # through).  Returns the same for the move to make.
+    def choose(self, move_type, chosen):
+        jack = self.jack
+        preferred = (move_type, [board.node_id[loc] for loc in chosen])
+        moves = self.candidates()
+        if preferred in moves:
+            moves.remove(preferred)
+        moves.insert(0, preferred)
+
+        # Play the moves in turn until every one has had its rollouts or the time is up
+        wins = [0] * len(moves)
+        played = [0] * len(moves)
+        deadline = time.perf_counter() + jack.settings["lookahead_ms"] / 1000.0
+        for turn in range(jack.settings["lookahead_rollouts"] * len(moves)):
+            num = turn % len(moves)
+            kind, path = moves[num]
+            wins[num] += self.rollout(path[-1], jack.turn_count() + len(path))
+            played[num] += 1
+            if time.perf_counter() > deadline:
+                break
+
+        score = [w / max(p, 1) for w, p in zip(wins, played)]
+        best = 0
+        for num in range(1, len(moves)):
+            if not played[num]:
+                continue
+            margin = LOOKAHEAD_MARGIN if moves[num][0] in (NORMAL_MOVE, move_type) else LOOKAHEAD_CARD_MARGIN
+            if score[num] > score[best] + margin + 1 / math.sqrt(played[num]):
+                best = num
+        kind, path = moves[best]
+        path = [board.node_names[v] for v in path]
+        jack.godmode_print("Lookahead: %d rollouts over %d moves.  %s scored %.2f, %s scored %.2f." %
+                           (sum(played), len(moves), chosen, score[0], path, score[best]))
+        return kind, path
@@ -0,0 +1,263 @@
+'''
+MIT License
+
+Copyright (c) 2023 Brian Stormont
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+# Path finding backends for Jack.
+# Both take and return vertex names and accept a board.WeightOverlay for the 'weight' and 'safety_weight' channels.
+# The 'i_weight' channel is the investigators' point of view and ignores the overlay.
+#
+# CsrPaths runs on the flat arrays in board.graph and is what Jack uses by default.
+# NxPaths runs the same queries through networkx on the DiGraph, which is slower but handy for debugging.
+
+import random
+import board
+
+# Where Jack can head this turn, worked out from a single search from his position:
+#   target_dist   - {target: distance} for each of his remaining targets
+#   target        - the closest target (the earliest in his list on a tie)
+#   path          - a random shortest path to that target
+#   next_location - the first location along the path
+#   next_dist     - the distance to next_location, which is POISON or more if the way there is blocked
+# resample() draws a fresh path from the same search.
+class PathPlan:
+    def __init__(self, targets, target_dist, sample_path, distance):
+        self.target_dist = target_dist
+        self.target = min(targets, key=target_dist.get)
+        self.sample_path = sample_path
+        self.distance = distance
+        self.resample()
+
+    def resample(self):
+        self.path = self.sample_path(self.target)
+        self.next_location = board.next_location(self.path)
+        self.next_dist = self.distance(self.next_location)
+
+class CsrPaths:
+    def __init__(self):
+        self.graph = board.graph
+
+    def distance(self, src, dest, overlay, channel='safety_weight'):
+        dest_id = board.node_id[dest]
+        dist = self.graph.dijkstra(board.node_id[src], overlay, channel, targets=(dest_id,))
+        if dest_id not in dist:
+            raise ValueError("No path from %s to %s" % (src, dest))
+        return dist[dest_id]
+
+    # {vertex: distance} for every vertex within `cutoff` of `src`.  Nearest first on Jack's channels; the
+    # investigators' (i_weight) distances come from a breadth first search and are in no particular order.
+    def lengths_within(self, src, cutoff, overlay, channel='weight'):
+        if channel == 'i_weight':
+            dist = self.graph.bfs(board.node_id[src], cutoff)
+        else:
+            dist = self.graph.dijkstra(board.node_id[src], overlay, channel, cutoff=cutoff)
+        return {board.node_names[v]: d for v, d in dist.items()}
+
+    def all_shortest_paths(self, src, dest, overlay, channel='safety_weight'):
+        for path in self.graph.all_shortest_paths(board.node_id[src], board.node_id[dest], overlay, channel):
+            yield [board.node_names[v] for v in path]
+
+    def random_shortest_path(self, src, dest, overlay, channel='safety_weight', rng=random):
+        src_id = board.node_id[src]
+        dest_id = board.node_id[dest]
+        pred = self.graph.shortest_path_predecessors(src_id, dest_id, overlay, channel)
+        return [board.node_names[v] for v in sample_shortest_path(pred, src_id, dest_id, rng)]
+
+    def plan(self, src, targets, overlay, channel='safety_weight', rng=random):
+        src_id = board.node_id[src]
+        target_ids = [board.node_id[t] for t in targets]
+        pred = {src_id: []}
+        dist = self.graph.dijkstra(src_id, overlay, channel, targets=target_ids, pred=pred)
+        for t, v in zip(targets, target_ids):
+            if v not in dist:
+                raise ValueError("No path from %s to %s" % (src, t))
+
+        def sample_path(target):
+            return [board.node_names[v] for v in sample_shortest_path(pred, src_id, board.node_id[target], rng)]
+        return PathPlan(targets, {t: dist[v] for t, v in zip(targets, target_ids)},
+                        sample_path, lambda loc: dist[board.node_id[loc]])
+
+class NxPaths:
+    def __init__(self, g):
+        # networkx takes a good part of a second to import, so only this backend loads it
+        import networkx
+        self.nx = networkx
+        self.graph = g
+
+    def weight(self, overlay, channel):
+        if channel == 'i_weight':
+            return i_weight_function()
+        return overlay.weight_function(channel)
+
+    # networkx raises its own NetworkXNoPath when `dest` can't be reached; these all raise the same ValueError
+    # as CsrPaths instead, so callers work with either backend
+    def distance(self, src, dest, overlay, channel='safety_weight'):
+        try:
+            return self.nx.shortest_path_length(self.graph, source=src, target=dest, weight=self.weight(overlay, channel))
+        except self.nx.NetworkXNoPath:
+            raise ValueError("No path from %s to %s" % (src, dest)) from None
+
+    def lengths_within(self, src, cutoff, overlay, channel='weight'):
+        return self.nx.single_source_dijkstra_path_length(self.graph, src, cutoff=cutoff, weight=self.weight(overlay, channel))
+
+    def all_shortest_paths(self, src, dest, overlay, channel='safety_weight'):
+        try:
+            yield from self.nx.all_shortest_paths(self.graph, src, dest, weight=self.weight(overlay, channel))
+        except self.nx.NetworkXNoPath:
+            raise ValueError("No path from %s to %s" % (src, dest)) from None
+
+    def random_shortest_path(self, src, dest, overlay, channel='safety_weight', rng=random):
+        pred, dist = self.nx.dijkstra_predecessor_and_distance(self.graph, src, weight=self.weight(overlay, channel))
+        if dest not in pred:
+            raise ValueError("No path from %s to %s" % (src, dest))
+        return sample_shortest_path(pred, src, dest, rng)
+
+    def plan(self, src, targets, overlay, channel='safety_weight', rng=random):
+        pred, dist = self.nx.dijkstra_predecessor_and_distance(self.graph, src, weight=self.weight(overlay, channel))
+        for t in targets:
+            if t not in dist:
+                raise ValueError("No path from %s to %s" % (src, t))
+        return PathPlan(targets, {t: dist[t] for t in targets},
+                        lambda target: sample_shortest_path(pred, src, target, rng), dist.get)
+
+
+# The investigators' weight for each edge, keyed by (u, v) name, taken from board.graph the first time
+# it is needed.  Nothing is stored on the networkx graph itself, so it can be shared by every game.
+nx_i_weights = {}
+
+def i_weight_function():
+    if not nx_i_weights:
+        g = board.graph
+        for u in range(len(board.node_names)):
+            for e in g.out_edges(u):
+                nx_i_weights[(board.node_names[u], board.node_names[g.targets[e]])] = g.i_weight[e]
+    return lambda u, v, d: nx_i_weights[(u, v)]
+
+
+# Draw one of the shortest paths from `src` to `dest` uniformly at random, straight from the predecessor
+# lists of a Dijkstra search, without listing every path first.
+#
+# The predecessor graph is not quite a DAG: crossings joined by zero weight edges can be each other's
+# predecessors.  Like networkx's all_shortest_paths(), only simple paths count, so a path crosses each
+# strongly connected group of vertices once, along one of the simple paths inside it.  The paths are
+# counted group by group, then one is drawn walking back from `dest` with every choice weighted by the
+# number of paths behind it, which gives each shortest path the same chance of being picked.
+def sample_shortest_path(pred, src, dest, rng=random):
+    groups, group_of = predecessor_groups(pred, dest)
+
+    arriving = {}   # vertex -> number of paths from src that enter the vertex's group at the vertex
+    ending = {}     # vertex -> number of paths from src that end at the vertex
+    inside = {}     # (a, b) -> simple paths from a to b that stay inside their group
+    for num, group in enumerate(groups):
+        for a in group:
+            arriving[a] = sum(ending[p] for p in pred[a] if group_of[p] != num)
+            if a == src:
+                arriving[a] += 1
+        if len(group) == 1:
+            ending[group[0]] = arriving[group[0]]
+        else:
+            paths_inside_group(group, pred, inside)
+            for b in group:
+                ending[b] = sum(len(inside.get((a, b), ())) * arriving[a] for a in group)
+
+    path = []
+    b = dest
+    while b is not None:
+        num = group_of[b]
+        if len(groups[num]) == 1:
+            a = b
+            path.append(b)
+        else:
+            a = weighted_choice([(a, len(inside.get((a, b), ())) * arriving[a]) for a in groups[num]], rng)
+            path.extend(reversed(rng.choice(inside[(a, b)])))
+
+        # Step back to the group before this one, or stop if the path starts here
+        options = [(p, ending[p]) for p in pred[a] if group_of[p] != num]
+        if a == src:
+            options.append((None, 1))
+        b = weighted_choice(options, rng)
+
+    path.reverse()
+    return path
+
+def weighted_choice(options, rng):
+    r = rng.randrange(sum(weight for item, weight in options))
+    for item, weight in options:
+        if r < weight:
+            return item
+        r -= weight
+
+# Strongly connected groups of the vertices that lead to `dest` through the predecessor lists (Tarjan's
+# algorithm without recursion).  A group is only listed after the groups of all its predecessors.
+def predecessor_groups(pred, dest):
+    index = {dest: 0}
+    low = {dest: 0}
+    stack = [dest]
+    on_stack = {dest}
+    groups = []
+    group_of = {}
+    work = [(dest, iter(pred[dest]))]
+    while work:
+        v, remaining = work[-1]
+        for p in remaining:
+            if p not in index:
+                index[p] = low[p] = len(index)
+                stack.append(p)
+                on_stack.add(p)
+                work.append((p, iter(pred[p])))
+                break
+            elif p in on_stack:
+                low[v] = min(low[v], index[p])
+        else:
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[v])
+            if low[v] == index[v]:
+                group = []
+                while True:
+                    w = stack.pop()
+                    on_stack.discard(w)
+                    group_of[w] = len(groups)
+                    group.append(w)
+                    if w == v:
+                        break
+                groups.append(group)
+    return groups, group_of
+
+# Fill `inside` with every simple path between each pair of vertices in the group, keeping to the group
+def paths_inside_group(group, pred, inside):
+    members = set(group)
+    successors = {v: [] for v in group}
+    for v in group:
+        for p in pred[v]:
+            if p in members:
+                successors[p].append(v)
+
+    for a in group:
+        stack = [[a]]
+        while stack:
+            path = stack.pop()
+            inside.setdefault((a, path[-1]), []).append(path)
+            for v in successors[path[-1]]:
+                if v not in path:
+                    stack.append(path + [v])
@@ -0,0 +1,163 @@
+'''
+MIT License
+
+Copyright (c) 2023 Brian Stormont
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+# Compact binary records of whole games, for replaying them through a newer Jack (see replay.py).
+#
+# A record file is the header "WHGR" + a version byte, followed by one block per game:
+#   seed (u64), investigator positions at the start (3 x u16), Jack's targets (4 x u16, the first crime first),
+#   number of bytes of events (u32), then the events in the order they happened.  The first event is
+#   always Jack's opening move, which he makes as the game starts.
+# Every vertex is stored as its board.node_id, and all numbers are little endian.
+#
+# Events start with their type byte:
+#   EVENT_IPOS    the three investigator positions after they moved (3 x u16)
+#   EVENT_JACK    Jack's move: travel type (NORMAL_MOVE, BOAT_MOVE, ALLEY_MOVE or COACH_MOVE),
+#                 number of locations he moved through (u8, 2 for a coach, 0 if he could not move), the locations (u16 each)
+#   EVENT_CLUES   a clue search: number of locations (u8), index of the one with the clue (u8, NO_CLUE if none), the locations
+#   EVENT_ARREST  an arrest attempt: location (u16), 1 if Jack was caught (u8)
+
+import struct
+
+import board
+
+MAGIC = b"WHGR"
+VERSION = 1
+
+EVENT_IPOS = 1
+EVENT_JACK = 2
+EVENT_CLUES = 3
+EVENT_ARREST = 4
+
+NO_CLUE = 255
+
+# Seeds are stored as a u64, so games can only be started from seeds 0 to MAX_SEED (see GameSession.start)
+MAX_SEED = 2**64 - 1
+
+game_header = struct.Struct("<Q3H4HI")
+ipos_event = struct.Struct("<B3H")
+jack_event = struct.Struct("<BBB")
+clues_event = struct.Struct("<BBB")
+arrest_event = struct.Struct("<BHB")
+
+def ids(names):
+    return [board.node_id[name] for name in names]
+
+def names(ids):
+    return [board.node_names[v] for v in ids]
+
+# Records the games played in a GameSession (see GameSession.recorder) to a record file
+class GameRecorder:
+    def __init__(self, filename):
+        self.file = open(filename, 'wb')
+        self.file.write(MAGIC + bytes([VERSION]))
+        self.header = None
+        self.events = bytearray()
+
+    def start_game(self, jack, travel):
+        self.finish_game()
+        self.header = (jack.seed, *ids(jack.ipos), *ids(jack.crimes + jack.targets))
+        self.events = bytearray()
+        self.jack_move(travel, jack.path_used[1:])
+
+    def ipos(self, ipos):
+        self.events += ipos_event.pack(EVENT_IPOS, *ids(ipos))
+
+    def jack_move(self, travel, moved):
+        self.events += jack_event.pack(EVENT_JACK, travel, len(moved))
+        self.events += struct.pack("<%dH" % len(moved), *ids(moved))
+
+    def clues(self, locations, found):
+        found_index = locations.index(found) if found is not None else NO_CLUE
+        self.events += clues_event.pack(EVENT_CLUES, len(locations), found_index)
+        self.events += struct.pack("<%dH" % len(locations), *ids(locations))
+
+    def arrest(self, location, caught):
+        self.events += arrest_event.pack(EVENT_ARREST, board.node_id[location], 1 if caught else 0)
+
+    def finish_game(self):
+        if self.header is not None:
+            self.file.write(game_header.pack(*self.header, len(self.events)))
+            self.file.write(self.events)
+            self.header = None
+
+    def close(self):
+        self.finish_game()
+        self.file.close()
+
+# One recorded game, with the vertices turned back into names
+class GameRecord:
+    def __init__(self, seed, ipos, targets, events):
+        self.seed = seed
+        self.ipos = ipos
+        self.targets = targets
+        self.events = events   # (EVENT_IPOS, [positions]), (EVENT_JACK, travel, [locations]),
+                               # (EVENT_CLUES, [locations], found or None), (EVENT_ARREST, location, caught)
+
+# The raw bytes of each game in a record file, without decoding them (cheap to hand to other processes)
+def read_game_blocks(filename):
+    with open(filename, 'rb') as f:
+        data = f.read()
+    if data[:4] != MAGIC or data[4] != VERSION:
+        raise ValueError("%s is not a version %d game record file" % (filename, VERSION))
+    blocks = []
+    offset = 5
+    while offset < len(data):
+        length = game_header.size + game_header.unpack_from(data, offset)[-1]
+        blocks.append(data[offset:offset + length])
+        offset += length
+    return blocks
+
+def decode_game(block):
+    fields = game_header.unpack_from(block, 0)
+    seed = fields[0]
+    ipos = names(fields[1:4])
+    targets = names(fields[4:8])
+    events = []
+    offset = game_header.size
+    while offset < len(block):
+        kind = block[offset]
+        if kind == EVENT_IPOS:
+            events.append((EVENT_IPOS, names(ipos_event.unpack_from(block, offset)[1:])))
+            offset += ipos_event.size
+        elif kind == EVENT_JACK:
+            kind, travel, count = jack_event.unpack_from(block, offset)
+            offset += jack_event.size
+            events.append((EVENT_JACK, travel, names(struct.unpack_from("<%dH" % count, block, offset))))
+            offset += 2 * count
+        elif kind == EVENT_CLUES:
+            kind, count, found_index = clues_event.unpack_from(block, offset)
+            offset += clues_event.size
+            locations = names(struct.unpack_from("<%dH" % count, block, offset))
+            events.append((EVENT_CLUES, locations, locations[found_index] if found_index != NO_CLUE else None))
+            offset += 2 * count
+        elif kind == EVENT_ARREST:
+            kind, location, caught = arrest_event.unpack_from(block, offset)
+            events.append((EVENT_ARREST, board.node_names[location], caught == 1))
+            offset += arrest_event.size
+        else:
+            raise ValueError("Unknown event type %d in game record" % kind)
+    return GameRecord(seed, ipos, targets, events)
+
+def read_games(filename):
+    return [decode_game(block) for block in read_game_blocks(filename)]
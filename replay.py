@@ -0,0 +1,147 @@
+'''
+MIT License
+
+Copyright (c) 2023 Brian Stormont
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+# Replay recorded games (see record.py) through the current Jack and report every game where he
+# does something different: other targets, another move, or a different answer to a search or arrest.
+#
+#   python simulate.py --games 10000 --record before.whr
+#   ... change Jack ...
+#   python replay.py before.whr
+#
+# The investigators' moves are taken from the record, so only Jack is being played.  The games are
+# spread over every CPU core, like tournament.py.
+
+import argparse
+import multiprocessing
+import os
+import time
+
+from graph_data import *
+from record import *
+from session import GameSession
+
+# How many games a worker is handed at a time
+CHUNK_GAMES = 100
+
+TRAVEL_NAMES = {NORMAL_MOVE: "normal", BOAT_MOVE: "boat", ALLEY_MOVE: "alley", COACH_MOVE: "coach"}
+
+# Play `record` again in `session`.  Returns (number of Jack moves compared, description of the
+# first divergence or None).  Once Jack diverges the rest of the record no longer applies, so the
+# replay stops there.
+def replay_game(session, record):
+    jack = session.jack
+    jack.set_ipos(list(record.ipos))
+    session.start(record.seed)
+    targets = jack.crimes + jack.targets
+    if targets != record.targets:
+        return 0, "targets %s instead of %s" % (targets, record.targets)
+
+    moves = 0
+    for number, event in enumerate(record.events):
+        kind = event[0]
+        if kind == EVENT_IPOS:
+            session.ipos(event[1])
+        elif kind == EVENT_JACK:
+            if number == 0:
+                # Jack's opening move was made by start()
+                moved = session.jack_moved(0, 0)
+            else:
+                crimes = len(jack.crimes)
+                path_length = len(jack.path_used)
+                session.move_jack()
+                moved = session.jack_moved(crimes, path_length)
+            travel = session.travel_type()
+            moves += 1
+            if moved != event[2] or travel != event[1]:
+                return moves, "move %d: Jack went %s by %s instead of %s by %s" % (
+                    moves, moved, TRAVEL_NAMES[travel], event[2], TRAVEL_NAMES[event[1]])
+        elif kind == EVENT_CLUES:
+            found = session.clues(event[1]).value
+            if found != event[2]:
+                return moves, "event %d: searching %s found a clue at %s instead of %s" % (number, event[1], found, event[2])
+        elif kind == EVENT_ARREST:
+            arrested = session.arrest(event[1]).value
+            if arrested != event[2]:
+                return moves, "event %d: arrest at %s %s" % (number, event[1], "succeeded" if arrested else "failed")
+    return moves, None
+
+worker_session = None
+
+def replay_chunk(task):
+    global worker_session
+    first, blocks = task
+    if worker_session is None:
+        worker_session = GameSession()
+    moves = 0
+    divergences = []
+    for index, block in enumerate(blocks):
+        record = decode_game(block)
+        game_moves, divergence = replay_game(worker_session, record)
+        moves += game_moves
+        if divergence is not None:
+            divergences.append((first + index, record.seed, divergence))
+    return len(blocks), moves, divergences
+
+# Replay every game in `filename`.  Returns (games, Jack moves compared, divergences), where each
+# divergence is (game number, seed, what happened).
+def replay(filename, workers=None):
+    blocks = read_game_blocks(filename)
+    tasks = [(first, blocks[first:first + CHUNK_GAMES]) for first in range(0, len(blocks), CHUNK_GAMES)]
+    if workers == 1:
+        # Not worth starting a pool for
+        results = list(map(replay_chunk, tasks))
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            results = list(pool.imap_unordered(replay_chunk, tasks))
+
+    games = 0
+    moves = 0
+    divergences = []
+    for chunk_games, chunk_moves, chunk_divergences in results:
+        games += chunk_games
+        moves += chunk_moves
+        divergences += chunk_divergences
+    return games, moves, sorted(divergences)
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded games and report where Jack now plays differently")
+    parser.add_argument("record", help="game record file written by simulate.py --record")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes (default: one per core)")
+    parser.add_argument("--show", type=int, default=20, help="how many divergences to list")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    games, moves, divergences = replay(args.record, args.workers)
+    elapsed = time.perf_counter() - start
+
+    for game, seed, divergence in divergences[:args.show]:
+        print("Game %d (seed %d): %s" % (game, seed, divergence))
+    if len(divergences) > args.show:
+        print("... and %d more" % (len(divergences) - args.show))
+    print("%d of %d games diverged" % (len(divergences), games))
+    print("%d games (%d Jack moves) replayed in %.1fs with %d workers (%.1f games/s)" %
+          (games, moves, elapsed, args.workers, games / elapsed))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,474 @@
+'''
+MIT License
+
+Copyright (c) 2023 Brian Stormont
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+# One game of Whitehall Mystery, without any GUI.
+# A session owns its Jack and the turn bookkeeping, while the board is shared, so a process can
+# host as many games as it likes.  The player commands are methods returning a CommandResult;
+# command() takes the same text commands as the GUI's command box.
+
+from jack import *
+from graph_data import *
+from belief import BeliefTracker
+import board
+import record
+
+INVESTIGATORS = ["y", "b", "r"]
+DEFAULT_IPOS = ["87c1", "77c1", "86c1"]
+
+# When Jack asks for the map to be redrawn, the output reporter gets a BOARD_DELTA_MSG instead, with a list
+# of what changed on the board since the last one.  Each change is a tuple starting with its kind:
+#   (TURN_CHANGED, turn)                 the turn track moved on (or back), see game_turn()
+#   (INVESTIGATOR_MOVED, num, crossing)  investigator `num` (0 yellow, 1 blue, 2 red) is now on `crossing`
+#   (CRIME_ADDED, location) and (CRIME_REMOVED, location)
+#   (CLUE_ADDED, location) and (CLUE_REMOVED, location)
+#   (PATH_ADDED, location) and (PATH_REMOVED, location)   where Jack has been this round
+#   (JACK_MOVED, location)               where Jack is (0 before the first game)
+#   (GODMODE_CHANGED, on)
+TURN_CHANGED = "turn changed"
+INVESTIGATOR_MOVED = "investigator moved"
+CRIME_ADDED = "crime added"
+CRIME_REMOVED = "crime removed"
+CLUE_ADDED = "clue added"
+CLUE_REMOVED = "clue removed"
+PATH_ADDED = "path added"
+PATH_REMOVED = "path removed"
+JACK_MOVED = "jack moved"
+GODMODE_CHANGED = "godmode changed"
+
+# The board as it is before anything has been shown
+EMPTY_BOARD = {"turn": None, "ipos": [None, None, None], "crimes": [], "clues": [], "path": [],
+               "jack_pos": None, "godmode": False}
+
+# What came of a command:
+#   ok       - False if the command was refused (malformed input, or not the players' turn)
+#   messages - the text Jack printed while handling it
+#   events   - (message type, value) pairs for SPECIAL_TRAVEL_MSG and NEW_ROUND_MSG notifications
+#   value    - the command's answer: the clue found for clues(), True for a successful arrest(),
+#              the game state for status()
+#   state    - the game state afterwards, see GameSession.state()
+class CommandResult:
+    def __init__(self, ok, messages, events, value, state):
+        self.ok = ok
+        self.messages = messages
+        self.events = events
+        self.value = value
+        self.state = state
+
+    def __repr__(self):
+        return "CommandResult(ok=%r, value=%r, messages=%r)" % (self.ok, self.value, self.messages)
+
+class GameSession:
+    # `graph` is the networkx board (see whitehall.py), only needed for the "networkx" backend.  Jack never
+    # changes it, so every session can be handed the same one.
+    # With `echo` the messages are printed as well, when no output reporter is registered.
+    # `settings` are passed on to Jack to tune his behaviour.
+    def __init__(self, graph=None, ipos=None, backend="csr", log_file=None, echo=False, settings=None):
+        self.jack = Jack(graph, list(ipos if ipos is not None else DEFAULT_IPOS), backend, log_file, settings)
+        self.jack.register_output_reporter(self.collect_output)
+        self.player_move_allowed = True
+        self.echo = echo
+        self.output_func = None
+        self.self_test_func = None
+        self.messages = []
+        self.events = []
+        # A record.GameRecorder to keep a binary record of every game played
+        self.recorder = None
+        # Where Jack could be, from what the investigators have seen
+        self.belief = BeliefTracker()
+        # The board as the output reporter was last told about it, see board_changes()
+        self.shown = dict(EMPTY_BOARD)
+
+    # Pass Jack's output on to a GUI (or anything else taking the same arguments as Jack's output reporter).
+    # The first BOARD_DELTA_MSG it gets has everything on the board in it.
+    def register_output_reporter(self, func):
+        self.output_func = func
+        self.shown = dict(EMPTY_BOARD)
+
+    def collect_output(self, output_type, *args):
+        if output_type == IMG_REFRESH:
+            if self.output_func is not None:
+                changes = self.board_changes()
+                if changes:
+                    self.output_func(BOARD_DELTA_MSG, changes)
+            return
+
+        if output_type == TEXT_MSG:
+            self.messages.append(" ".join(str(m) for m in args))
+        elif output_type in (SPECIAL_TRAVEL_MSG, NEW_ROUND_MSG):
+            self.events.append((output_type, args[0]))
+
+        if self.output_func is not None:
+            self.output_func(output_type, *args)
+        elif self.echo and output_type == TEXT_MSG:
+            print(*args)
+
+    def print(self, *msg):
+        self.jack.print(*msg)
+
+    def begin(self):
+        self.messages = []
+        self.events = []
+
+    def result(self, ok, value=None):
+        return CommandResult(ok, self.messages, self.events, value, self.state())
+
+    # A snapshot of what the players can see.  Jack's position is only given once the game is over.
+    def state(self):
+        jack = self.jack
+        return {
+            "in_progress": jack.game_in_progress,
+            "winner": jack.win,
+            "turn": jack.turn_count(),
+            "moves_remaining": 16 - jack.turn_count(),
+            "ipos": list(jack.ipos),
+            "crimes": list(jack.crimes),
+            "clues": list(jack.clues),
+            "searched": list(jack.searched),
+            "boat_cards": 2 - len(jack.boat_cards),
+            "alley_cards": 2 - len(jack.alley_cards),
+            "coach_cards": 2 - len(jack.coach_cards),
+            "player_move_allowed": self.player_move_allowed,
+            "jack_pos": None if jack.game_in_progress else jack.pos,
+        }
+
+    # What the GUI shows of the game
+    def board_view(self):
+        jack = self.jack
+        return {
+            "turn": self.game_turn(),
+            "ipos": list(jack.ipos),
+            "crimes": list(jack.crimes),
+            "clues": list(jack.clues),
+            "path": list(jack.path_used),
+            "jack_pos": jack.pos,
+            "godmode": jack.godmode,
+        }
+
+    # What changed on the board since the output reporter was last told (see TURN_CHANGED and the rest)
+    def board_changes(self):
+        old = self.shown
+        new = self.shown = self.board_view()
+        changes = []
+        if new["turn"] != old["turn"]:
+            changes.append((TURN_CHANGED, new["turn"]))
+        for num, (before, after) in enumerate(zip(old["ipos"], new["ipos"])):
+            if before != after:
+                changes.append((INVESTIGATOR_MOVED, num, after))
+        for key, added, removed in (("crimes", CRIME_ADDED, CRIME_REMOVED), ("clues", CLUE_ADDED, CLUE_REMOVED),
+                                    ("path", PATH_ADDED, PATH_REMOVED)):
+            changes += [(removed, loc) for loc in old[key] if loc not in new[key]]
+            changes += [(added, loc) for loc in new[key] if loc not in old[key]]
+        if new["jack_pos"] != old["jack_pos"]:
+            changes.append((JACK_MOVED, new["jack_pos"]))
+        if new["godmode"] != old["godmode"]:
+            changes.append((GODMODE_CHANGED, new["godmode"]))
+        return changes
+
+    # The investigators can always be placed before a game starts
+    def investigators_may_move(self):
+        return self.jack.godmode or self.player_move_allowed or not self.jack.game_in_progress
+
+    def recording(self):
+        return self.recorder is not None and self.jack.game_in_progress
+
+    ##########################################
+    # Player commands
+
+    # `seed` replays a particular game; see Jack.reset()
+    def start(self, seed=None):
+        self.begin()
+        # Checked before anything changes, so a bad seed can't leave a half-written game in the record file
+        if seed is not None and not 0 <= seed <= record.MAX_SEED:
+            self.print("The seed must be from 0 to %d" % record.MAX_SEED)
+            return self.result(False)
+        self.jack.reset(seed)
+        self.player_move_allowed = True
+        self.belief.reset()
+        self.belief.follow(self.jack, self.travel_type())
+        if self.recorder is not None:
+            self.recorder.start_game(self.jack, self.travel_type())
+        return self.result(True)
+
+    def move_jack(self):
+        self.begin()
+        jack = self.jack
+        was_in_progress = jack.game_in_progress
+        crimes = len(jack.crimes)
+        path_length = len(jack.path_used)
+        jack.move()
+        self.player_move_allowed = True
+        self.belief.follow(jack, self.travel_type())
+        if was_in_progress and self.recorder is not None:
+            self.recorder.jack_move(self.travel_type(), self.jack_moved(crimes, path_length))
+        return self.result(was_in_progress)
+
+    # The special travel Jack announced during the last command, if any
+    def travel_type(self):
+        travel = NORMAL_MOVE
+        for output_type, value in self.events:
+            if output_type == SPECIAL_TRAVEL_MSG:
+                travel = value
+        return travel
+
+    # The locations Jack moved through, given the number of crimes and the length of his path beforehand
+    def jack_moved(self, crimes, path_length):
+        jack = self.jack
+        if len(jack.crimes) > crimes:
+            # A new round starts his path over at the crime
+            return jack.path_used[1:]
+        return jack.path_used[path_length:]
+
+    # Place all three investigators, e.g. ipos(["87c1", "77c1", "86c1"])
+    def ipos(self, positions):
+        self.begin()
+        if not self.investigators_may_move():
+            self.print("It's Jack's turn to move now, not yours.")
+            return self.result(False)
+        values = self.check_ipos(positions)
+        if len(values) != 3:
+            self.print("Usage: ipos <pos1>, <pos2>, <pos3>")
+            return self.result(False)
+        self.jack.set_ipos(values)
+        if self.recording():
+            self.recorder.ipos(self.jack.ipos)
+        return self.result(True)
+
+    # Move investigator `num` (0 yellow, 1 blue, 2 red) to a crossing
+    def move_investigator(self, num, pos):
+        self.begin()
+        if not self.investigators_may_move():
+            self.print("It's Jack's turn to move now, not yours.")
+            return self.result(False)
+        if not self.check_crossing(pos):
+            return self.result(False)
+        # I could just modify jack.ipos directly, but we use the API to ensure the map gets redrawn
+        ipos = self.jack.ipos
+        if pos in ipos and ipos.index(pos) != num:
+            self.print("Cannot move investigator to an already occupied space.")
+            return self.result(False)
+        ipos[num] = pos
+        self.jack.set_ipos(ipos)
+        if self.recording():
+            self.recorder.ipos(self.jack.ipos)
+        return self.result(True)
+
+    def clues(self, locations):
+        self.begin()
+        pos_list = self.check_clues(locations)
+        if len(pos_list) == 0:
+            return self.result(False)
+        recording = self.recording()
+        found = self.jack.clue_search(pos_list)
+        self.player_move_allowed = False
+        self.belief.follow(self.jack)
+        if recording:
+            self.recorder.clues(pos_list, found)
+        return self.result(True, found)
+
+    def arrest(self, pos):
+        self.begin()
+        if not self.check_location(pos):
+            return self.result(False)
+        recording = self.recording()
+        arrested = self.jack.arrest(pos)
+        self.player_move_allowed = False
+        if recording:
+            self.recorder.arrest(pos, arrested)
+        return self.result(True, arrested)
+
+    def status(self):
+        self.begin()
+        self.jack.status()
+        return self.result(True, self.state())
+
+    # Where Jack could be, worked out only from what the investigators know
+    def hint(self):
+        self.begin()
+        possible = self.belief.possible_locations()
+        if not self.jack.crimes:
+            self.print("No crime has been discovered yet.")
+        else:
+            self.print("Jack could be at any of these %d locations:" % len(possible), possible)
+        return self.result(True, possible)
+
+    ##########################################
+    # Input checking
+
+    def check_ipos(self, values):
+        for value in values:
+            if value not in board.crossings:
+                self.print(value, " is not a valid investigator location.")
+                return []
+        return values
+
+    def check_clues(self, values):
+        for value in values:
+            if value not in board.locations:
+                self.print(value, " is not a valid location.")
+                return []
+        return values
+
+    def check_location(self, value):
+        if value not in board.locations:
+            self.print(value, " is not a valid location.")
+            return False
+        return True
+
+    def check_crossing(self, value):
+        if value not in board.crossings:
+            self.print(value, " is not a valid crossing.")
+            return False
+        return True
+
+    ##########################################
+    # Text commands
+
+    # Run one line of the text interface and return its CommandResult
+    # NOTE: This does only very rudimentary syntax checking. It is NOT a feature-rich UI
+    #       For example, it does simple substring matching for some commands.
+    def command(self, user_input):
+        jack = self.jack
+        jack.log_to_file("\033[1m>", user_input, "\033[0m")
+
+        split_input = user_input.split(" ", 1)
+        command = split_input[0]
+        parms = split_input[-1]   # Note: this can end up being the same as command if no arguments were supplied
+
+        if "jack" == command:
+            return self.move_jack()
+
+        elif "start" == command:
+            if len(split_input) > 1 and parms.strip():
+                if not parms.strip().isdigit():
+                    self.begin()
+                    self.print("Usage: start [seed]")
+                    return self.result(False)
+                return self.start(int(parms))
+            return self.start()
+
+        elif "ipos" == command:
+            return self.ipos(split_list(parms))
+
+        elif "status" == command:
+            return self.status()
+
+        elif "hint" == command:
+            return self.hint()
+
+        elif "arrest" == command:
+            return self.arrest(parms.strip())
+
+        elif "clues" == command:
+            return self.clues(split_list(parms))
+
+        elif command in INVESTIGATORS:
+            return self.move_investigator(INVESTIGATORS.index(command), parms.strip())
+
+        self.begin()
+        ok = True
+        if "godmode" == command:
+            if parms == "on":
+                jack.godmode = True
+                self.print("Godmode is now on.")
+                jack.make_image()
+            elif parms == "off":
+                jack.godmode = False
+                self.print("Godmode is now off.")
+                jack.make_image()
+            else:
+                self.print("Usage: godmode <on,off>")
+                ok = False
+
+        elif "map" == command:
+            jack.make_image()
+
+        elif jack.godmode and "jackpos" == command:
+            pos = parms.strip()
+            ok = self.check_location(pos)
+            if ok:
+                jack.pos = pos
+                jack.make_image()
+
+        elif jack.godmode and "cost" == command:
+            values = split_list(parms)
+            if len(values) != 2:
+                self.print("Must enter two (and only two) locations")
+                ok = False
+            else:
+                for value in values:
+                    if value not in board.node_id:
+                        self.print(value, " is not a valid location.")
+                        ok = False
+                        break
+                if ok:
+                    self.print(jack.path_length(values[0], values[1]))
+
+        elif jack.godmode and "self_test" == command:
+            if self.self_test_func is not None:
+                self.self_test_func()
+
+        elif "exit" == command:
+            exit()
+
+        elif "help" == command:
+            self.help()
+
+        else:
+            self.print("Unknown command.")
+            ok = False
+        return self.result(ok)
+
+    def help(self):
+        jack = self.jack
+        jack.print("Commands are:")
+        jack.print(" \033[1mjack\033[0m:    Jack takes his turn")
+        jack.print(" \033[1mstart [seed]\033[0m:   Start a new game (CAUTION: typing this mid-game will RESTART the game).  Give the seed from a log to replay a game.")
+
+        jack.print(" \033[1mipos <pos1>, <pos2>, <pos3>\033[0m:  Enter the investigator locations")
+        jack.print(" \033[1my <pos1>\033[0m:  Move the yellow investigator")
+        jack.print(" \033[1mb <pos1>\033[0m:  Move the blue investigator")
+        jack.print(" \033[1mr <pos1>\033[0m:  Move the red investigator")
+
+        jack.print(" \033[1mstatus\033[0m:    View the current game status")
+        jack.print(" \033[1mhint\033[0m:    List the locations Jack could be at, going by what the investigators know")
+        jack.print(" \033[1marrest <pos>\033[0m:    Attempt arrest at the specified position")
+        jack.print(" \033[1mclues <pos1>,..,<posX>\033[0m:    Search for clues at the supplied locations in the specified order")
+        jack.print(" \033[1mmap\033[0m:    Force the map file to be updated immediately with the current game state")
+        jack.print(" \033[1mexit\033[0m:    Completely exit the program.")
+        jack.print(" \033[1mgodmode <on,off>\033[0m:    Toggle godmode")
+        jack.godmode_print("  \033[1mjackpos <pos>\033[0m:    Move Jack to the specified location for debugging")
+        jack.godmode_print("  \033[1mcost <pos1>, <pos2>\033[0m:    Show the distance between two vertices (for weight debugging)")
+        jack.godmode_print("  \033[1mself_test\033[0m:    Run some self-tests")
+
+    def game_turn(self):
+        turn = self.jack.turn_count()-1
+        if turn < 0:
+            turn = 0
+        return turn
+
+# "a, b,c" -> ["a", "b", "c"]
+def split_list(text):
+    if not text:
+        return []
+    return [value.strip() for value in text.split(',')]
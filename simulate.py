@@ -0,0 +1,349 @@
+'''
+MIT License
+
+Copyright (c) 2023 Brian Stormont
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+# Self-play: Jack against scripted investigators, many games in a row, without the GUI.
+# Handy for checking how a change to Jack's behaviour (TURN_BUFFER, DEFAULT_ALLEY_WEIGHT,
+# DETERRENT_WEIGHTS, ...) plays out over a few thousand games.
+#
+#   python simulate.py --games 1000 --policy greedy
+#
+# With --record the games are saved for replay.py, to check a later version of Jack against them.
+#
+# The investigators only use what the players could see: crimes, clues and their own searches.
+
+import argparse
+import random
+import time
+
+from jack import *
+from graph_data import *
+import board
+from board import POISON
+from session import GameSession
+from record import GameRecorder, MAX_SEED
+
+# Jack gets 16 moves per round and there are 4 rounds; anything much longer has gone wrong
+MAX_JACK_MOVES = 80
+
+# How the game ended
+JACK_WON = "jack won"
+ARRESTED = "arrested"
+TRAPPED = "trapped"
+FORFEIT = "out of moves"
+UNFINISHED = "unfinished"
+
+# Every location, in vertex id order, so choices among them do not depend on set ordering
+LOCATIONS = sorted(board.locations, key=board.node_id.get)
+
+# BeliefPolicy tries an arrest once Jack is down to this many likely locations
+ARREST_CANDIDATES = 8
+
+# Moves on foot between two vertices, the same way Jack counts them
+def hops(src, dest):
+    return board.hop_table(POISON, POISON).distance(board.node_id[src], board.node_id[dest])
+
+class InvestigatorPolicy:
+    def __init__(self, rng):
+        self.rng = rng
+        self.round = None
+        self.searched = set()   # locations searched for clues this round
+
+    # The investigators' turn: move everybody, then each one searches or makes an arrest
+    def play(self, session):
+        state = session.state()
+        if self.round != len(state["crimes"]):
+            self.round = len(state["crimes"])
+            self.searched = set()
+
+        # Investigators move one at a time and cannot end on an occupied crossing
+        positions = list(state["ipos"])
+        for num in range(3):
+            occupied = set(positions[:num] + positions[num+1:])
+            options = [c for c in session.jack.investigator_crossing_options(num) if c not in occupied]
+            positions[num] = self.choose_crossing(num, options, state)
+        session.ipos(positions)
+
+        clue_found = None
+        for num, pos in enumerate(positions):
+            action = self.action(num, pos, state, clue_found)
+            if action is None:
+                continue
+            kind, target = action
+            if kind == "arrest":
+                result = session.arrest(target)
+                if result.value:
+                    return ARRESTED
+            else:
+                result = session.clues(target)
+                for loc in target:
+                    self.searched.add(loc)
+                    if loc == result.value:
+                        break
+                if result.value is not None:
+                    clue_found = result.value
+                    state = result.state
+        return None
+
+    # Locations next to `pos` worth searching: not yet searched this round and not a crime scene
+    def search_candidates(self, pos, state):
+        return [loc for loc in board.locations_around(board.node_id[pos])
+                if loc not in self.searched and loc not in state["crimes"]]
+
+    # The latest thing known about where Jack has been: the newest clue, or else this round's crime
+    def focus(self, state):
+        if state["clues"]:
+            return state["clues"][-1]
+        return state["crimes"][-1]
+
+    # The option closest to `target`, picking at random among ties
+    def closest(self, options, target):
+        best = min(hops(target, c) for c in options)
+        return self.rng.choice([c for c in options if hops(target, c) == best])
+
+# Wander at random and search a random location nearby
+class RandomPolicy(InvestigatorPolicy):
+    def choose_crossing(self, num, options, state):
+        return self.rng.choice(options)
+
+    def action(self, num, pos, state, clue_found):
+        candidates = self.search_candidates(pos, state)
+        if candidates:
+            return ("clues", [self.rng.choice(candidates)])
+        return None
+
+# Jack nearly always walks straight away from the crime, so he passed the newest clue about as many moves
+# into the round as it is from the crime, and has been walking away from it since.  The investigators
+# close in on the locations that fit, arrest Jack at one of them whenever they can, and otherwise search
+# around the newest clue.
+class GreedyPolicy(InvestigatorPolicy):
+    def __init__(self, rng):
+        InvestigatorPolicy.__init__(self, rng)
+        self.suspects_key = None
+        self.suspects_found = None
+
+    # Where Jack probably is: as far from the crime as the moves he has made this round, and as far from
+    # the newest clue as the moves he has made since passing it.  Worked out once per turn and clue.
+    def suspects(self, state):
+        moves = state["turn"] - 1
+        crime = state["crimes"][-1]
+        focus = self.focus(state)
+        key = (moves, crime, focus)
+        if self.suspects_key != key:
+            since = moves - hops(crime, focus)
+            suspects = [loc for loc in LOCATIONS if hops(crime, loc) == moves and hops(focus, loc) == since
+                        and loc not in state["crimes"]]
+            self.suspects_key = key
+            self.suspects_found = suspects or [focus]
+        return self.suspects_found
+
+    def choose_crossing(self, num, options, state):
+        suspects = self.suspects(state)
+        return min(options, key=lambda c: (min(hops(c, loc) for loc in suspects), self.rng.random()))
+
+    def action(self, num, pos, state, clue_found):
+        around = board.locations_around(board.node_id[pos])
+        suspects = [loc for loc in self.suspects(state) if loc in around]
+        if suspects:
+            return ("arrest", self.rng.choice(suspects))
+        focus = self.focus(state)
+        candidates = sorted(self.search_candidates(pos, state), key=lambda loc: hops(focus, loc))
+        if candidates:
+            return ("clues", candidates)
+        return None
+
+# Spread out over the quarters of the board that have not had a crime yet (Jack visits one target
+# in each) and comb through their locations.
+class SweepPolicy(InvestigatorPolicy):
+    def open_quads(self, state):
+        return [q for q in quads if not any(crime in q for crime in state["crimes"])] or [quads[0]]
+
+    def quad_for(self, num, state):
+        open_quads = self.open_quads(state)
+        return open_quads[num % len(open_quads)]
+
+    def choose_crossing(self, num, options, state):
+        quad = self.quad_for(num, state)
+        unsearched = [loc for loc in quad if loc not in self.searched] or quad
+        target = min(unsearched, key=lambda loc: min(hops(loc, c) for c in options))
+        return self.closest(options, target)
+
+    def action(self, num, pos, state, clue_found):
+        quad = self.quad_for(num, state)
+        candidates = sorted(self.search_candidates(pos, state), key=lambda loc: loc not in quad)
+        if candidates:
+            return ("clues", candidates)
+        return None
+
+# Follow the session's belief tracker.  Jack nearly always heads straight away from the crime, so of the
+# locations he could be at, the ones farthest from it are where he most likely is.  The investigators close
+# in on those, search where he could have been, and make an arrest once there are only a few of them left
+# and one is next to an investigator.
+class BeliefPolicy(InvestigatorPolicy):
+    def play(self, session):
+        self.belief = session.belief
+        return InvestigatorPolicy.play(self, session)
+
+    # The locations Jack could be at that are farthest from this round's crime
+    def likely_locations(self, state):
+        possible = self.belief.possible_locations()
+        if not possible:
+            return [self.focus(state)]
+        crime = state["crimes"][-1]
+        farthest = max(hops(crime, loc) for loc in possible)
+        return [loc for loc in possible if hops(crime, loc) == farthest]
+
+    def choose_crossing(self, num, options, state):
+        likely = self.likely_locations(state)
+        return min(options, key=lambda c: (min(hops(c, loc) for loc in likely), sum(hops(c, loc) for loc in likely), self.rng.random()))
+
+    def action(self, num, pos, state, clue_found):
+        likely = self.likely_locations(state)
+        around = board.locations_around(board.node_id[pos])
+        suspects = [loc for loc in likely if loc in around]
+        if suspects and len(likely) <= ARREST_CANDIDATES:
+            return ("arrest", self.rng.choice(suspects))
+        trail = self.belief.possible_trail()
+        candidates = [loc for loc in self.search_candidates(pos, state) if trail >> board.node_id[loc] & 1]
+        if candidates:
+            return ("clues", candidates)
+        return None
+
+POLICIES = {
+    "random": RandomPolicy,
+    "greedy": GreedyPolicy,
+    "sweep": SweepPolicy,
+    "belief": BeliefPolicy,
+}
+
+# The statistics from a batch of games
+class SimulationStats:
+    def __init__(self):
+        self.outcomes = {}
+        self.round_lengths = []
+        self.move_times = []
+        self.games = 0
+
+    def add_outcome(self, outcome):
+        self.games += 1
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+    # Fold in the statistics from another batch
+    def merge(self, other):
+        self.games += other.games
+        for outcome, count in other.outcomes.items():
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + count
+        self.round_lengths += other.round_lengths
+        self.move_times += other.move_times
+
+    def win_rate(self):
+        return 100.0 * self.outcomes.get(JACK_WON, 0) / max(self.games, 1)
+
+    def average_round_length(self):
+        return sum(self.round_lengths) / max(len(self.round_lengths), 1)
+
+    def mean_move_time(self):
+        return sum(self.move_times) / max(len(self.move_times), 1)
+
+    def report(self, elapsed):
+        print("Games played: %d in %.1fs" % (self.games, elapsed))
+        print("Jack's win rate: %.1f%%" % self.win_rate())
+        for outcome in (JACK_WON, ARRESTED, TRAPPED, FORFEIT, UNFINISHED):
+            if outcome in self.outcomes:
+                print("    %-14s %d" % (outcome + ":", self.outcomes[outcome]))
+        if self.round_lengths:
+            print("Average moves per round: %.2f" % self.average_round_length())
+        if self.move_times:
+            times = sorted(self.move_times)
+            print("Jack's move time: mean %.2fms  median %.2fms  95%% %.2fms  max %.2fms" %
+                  (1000 * sum(times) / len(times), 1000 * times[len(times) // 2],
+                   1000 * times[int(len(times) * 0.95)], 1000 * times[-1]))
+
+# Play one game in `session` and return how it ended
+def play_game(session, policy, rng, seed, stats):
+    # A game cut off at MAX_JACK_MOVES is still going, and may leave it Jack's turn; end it so the
+    # investigators can be placed for this one
+    session.jack.game_in_progress = False
+    session.ipos(rng.sample(starting_ipos, 3))
+    session.start(seed)
+    jack = session.jack
+
+    for moves in range(MAX_JACK_MOVES):
+        crimes = len(jack.crimes)
+        turn = jack.turn_count()
+        start = time.perf_counter()
+        session.move_jack()
+        stats.move_times.append(time.perf_counter() - start)
+
+        # A new crime means Jack finished the previous round's trip
+        if len(jack.crimes) > crimes:
+            stats.round_lengths.append(turn - 1)
+
+        if not jack.game_in_progress:
+            return JACK_WON if jack.win == JACK_WINS else TRAPPED
+
+        # Jack gives up once he can no longer reach his target in time
+        if 16 - jack.turn_count() < jack.hop_count(jack.pos, jack.active_target):
+            return FORFEIT
+
+        if policy.play(session) == ARRESTED:
+            return ARRESTED
+    return UNFINISHED
+
+# Play one game per seed.  The seed fixes the whole game, so the same seed gives the same game
+# (for the same Jack settings), whichever process plays it.
+def play_games(session, policy_name, seeds, stats):
+    for seed in seeds:
+        # Jack and the investigators each have their own generator, seeded from the game's seed.  The
+        # investigators' seed is made different from Jack's, or the two would draw the same numbers.
+        rng = random.Random("%d investigators" % seed)
+        policy = POLICIES[policy_name](rng)
+        stats.add_outcome(play_game(session, policy, rng, seed, stats))
+    return stats
+
+def simulate(games, policy_name, seed=0, log_file=None, settings=None, record_file=None):
+    session = GameSession(log_file=log_file, settings=settings)
+    if record_file is not None:
+        session.recorder = GameRecorder(record_file)
+    stats = play_games(session, policy_name, range(seed, seed + games), SimulationStats())
+    if session.recorder is not None:
+        session.recorder.close()
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Play Jack against scripted investigators")
+    parser.add_argument("--games", type=int, default=100, help="number of games to play")
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="greedy", help="how the investigators play")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the first game (the others follow on)")
+    parser.add_argument("--log", default=None, help="write Jack's log to this file (off by default)")
+    parser.add_argument("--record", default=None, help="save the games to this file for replay.py")
+    args = parser.parse_args()
+    if args.seed < 0 or args.seed + args.games - 1 > MAX_SEED:
+        parser.error("the seeds must be from 0 to %d" % MAX_SEED)
+
+    start = time.perf_counter()
+    stats = simulate(args.games, args.policy, args.seed, args.log, record_file=args.record)
+    stats.report(time.perf_counter() - start)
+
+if __name__ == "__main__":
+    main()
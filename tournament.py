@@ -0,0 +1,132 @@
+'''
+MIT License
+
+Copyright (c) 2023 Brian Stormont
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+# Try a grid of Jack's settings against the scripted investigators from simulate.py, using every CPU core.
+#
+#   python tournament.py --games 500 turn_buffer=2,3,4 alley_weight=10,13,16 deterrent_weights=6/3/1/0,4/2/0
+#
+# Each setting is name=value,value,... (a list value is written with slashes) and every combination
+# is played.  See DEFAULT_SETTINGS in jack.py for the names.  All the combinations play the same
+# seeds, so they face the same starting positions and the same investigators.
+
+import argparse
+import itertools
+import multiprocessing
+import os
+import time
+
+from jack import DEFAULT_SETTINGS
+from session import GameSession
+from simulate import POLICIES, SimulationStats, play_games, ARRESTED, TRAPPED, FORFEIT, UNFINISHED
+
+# How many games a worker is handed at a time
+CHUNK_GAMES = 25
+
+def parse_number(text):
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+# One value for setting `name`.  A list setting always gets a list, even from a single number.
+def parse_value(name, text):
+    if isinstance(DEFAULT_SETTINGS[name], list):
+        return [parse_number(part) for part in text.split('/')]
+    if '/' in text:
+        raise SystemExit("Bad value '%s' for %s: it takes a single number" % (text, name))
+    return parse_number(text)
+
+# ["a=1,2", "b=3"] -> [{"a": 1, "b": 3}, {"a": 2, "b": 3}]
+def parse_grid(specs):
+    names = []
+    choices = []
+    for spec in specs:
+        name, _, values = spec.partition('=')
+        if name not in DEFAULT_SETTINGS or not values:
+            raise SystemExit("Bad setting '%s'.  Use name=value,value,... with one of: %s" % (spec, ", ".join(DEFAULT_SETTINGS)))
+        names.append(name)
+        try:
+            choices.append([parse_value(name, value) for value in values.split(',')])
+        except ValueError:
+            raise SystemExit("Bad setting '%s': the values must be numbers" % spec)
+    return [dict(zip(names, combination)) for combination in itertools.product(*choices)]
+
+# The sessions a worker process has set up, by configuration number.  Each worker imports the board
+# once and keeps one session per configuration for all the chunks it plays.
+worker_sessions = {}
+
+def play_chunk(task):
+    index, settings, policy_name, seeds = task
+    if index not in worker_sessions:
+        worker_sessions[index] = GameSession(settings=settings)
+    return index, play_games(worker_sessions[index], policy_name, seeds, SimulationStats())
+
+# Play `games` games for every configuration and return one SimulationStats per configuration
+def run_tournament(configs, games, policy_name, seed=0, workers=None):
+    tasks = []
+    for index, settings in enumerate(configs):
+        for start in range(seed, seed + games, CHUNK_GAMES):
+            tasks.append((index, settings, policy_name, range(start, min(start + CHUNK_GAMES, seed + games))))
+
+    results = [SimulationStats() for settings in configs]
+    with multiprocessing.Pool(workers) as pool:
+        for index, stats in pool.imap_unordered(play_chunk, tasks):
+            results[index].merge(stats)
+    return results
+
+def print_table(configs, results):
+    names = sorted(set(name for settings in configs for name in settings))
+    columns = names + ["games", "win %", "arrested", "trapped", "no moves", "moves/round", "ms/move"]
+    rows = []
+    for settings, stats in zip(configs, results):
+        row = [settings[name] for name in names]
+        row += [stats.games, "%.1f" % stats.win_rate(), stats.outcomes.get(ARRESTED, 0), stats.outcomes.get(TRAPPED, 0),
+                stats.outcomes.get(FORFEIT, 0) + stats.outcomes.get(UNFINISHED, 0),
+                "%.2f" % stats.average_round_length(), "%.2f" % (1000 * stats.mean_move_time())]
+        rows.append([str(value).replace(' ', '') for value in row])
+    widths = [max(len(column), *(len(row[i]) for row in rows)) for i, column in enumerate(columns)]
+    print("  ".join(column.rjust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(value.rjust(width) for value, width in zip(row, widths)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Play Jack with a grid of settings against scripted investigators")
+    parser.add_argument("settings", nargs="*", help="name=value,value,... for each setting to vary")
+    parser.add_argument("--games", type=int, default=100, help="games per configuration")
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="belief", help="how the investigators play")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the first game (the others follow on)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes (default: one per core)")
+    args = parser.parse_args()
+
+    configs = parse_grid(args.settings)
+    start = time.perf_counter()
+    results = run_tournament(configs, args.games, args.policy, args.seed, args.workers)
+    elapsed = time.perf_counter() - start
+
+    print_table(configs, results)
+    total = sum(stats.games for stats in results)
+    print("%d games in %.1fs with %d workers (%.1f games/s)" % (total, elapsed, args.workers, total / elapsed))
+
+if __name__ == "__main__":
+    main()
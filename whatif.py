@@ -0,0 +1,182 @@
+'''
+MIT License
+
+Copyright (c) 2023 Brian Stormont
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+# What if the investigators moved there?  For every combination of crossings the three investigators
+# could move to this turn, ask Jack what he would do next, and rank the combinations by how badly it
+# goes for him: trapped first, then the farther he ends up from his target the better.
+#
+#   python whatif.py --seed 7 --moves 3 --budget 10
+#
+# The combinations are handed out in chunks to a pool of worker processes that stays up between
+# turns.  Each worker sets up the board and one Jack when it starts, and just loads a snapshot of the
+# game (Jack.snapshot()) for every chunk.  Every combination gets its own seed made from the game's seed
+# and the investigators' positions, so its answer does not depend on which worker played it or when.
+
+import argparse
+import itertools
+import multiprocessing
+import os
+import time
+from collections import deque
+
+from jack import *
+from graph_data import *
+from session import GameSession
+
+# How many combinations a worker is handed at a time
+CHUNK_COMBINATIONS = 50
+
+# What Jack would do if the investigators moved to `ipos`
+class WhatIf:
+    def __init__(self, ipos, pos, travel, distance, winner):
+        self.ipos = ipos           # the investigators' crossings
+        self.pos = pos             # where Jack would end up
+        self.travel = travel       # NORMAL_MOVE, BOAT_MOVE, ALLEY_MOVE or COACH_MOVE
+        self.distance = distance   # his moves left to his target from there
+        self.winner = winner       # INVESTIGATORS_WIN if he would be trapped, else None
+
+    # Sort key, best for the investigators first
+    def rank(self):
+        return (self.winner != INVESTIGATORS_WIN, -self.distance, self.ipos)
+
+    def __repr__(self):
+        return "WhatIf(%s -> %s, travel=%d, distance=%d, winner=%s)" % (self.ipos, self.pos, self.travel, self.distance, self.winner)
+
+##########################################
+# Worker side
+
+# Each worker process's own Jack, and the special travel he announced during the current move
+worker_jack = None
+worker_travel = []
+
+def worker_output(output_type, *args):
+    if output_type == SPECIAL_TRAVEL_MSG:
+        worker_travel.append(args[0])
+
+def init_worker(settings):
+    global worker_jack
+    worker_jack = Jack(None, list(starting_ipos[:3]), log_file=None, settings=settings)
+    worker_jack.register_output_reporter(worker_output)
+
+def what_if(jack, state, seed, ipos):
+    jack.restore(state)
+    jack.ipos = list(ipos)
+    jack.rng.seed("%s %s" % (seed, " ".join(ipos)))
+    del worker_travel[:]
+    jack.move()
+    travel = worker_travel[-1] if worker_travel else NORMAL_MOVE
+    distance = jack.hop_count(jack.pos, jack.active_target) if jack.game_in_progress else 0
+    return WhatIf(tuple(ipos), jack.pos, travel, distance, jack.win)
+
+def evaluate_chunk(task):
+    state, seed, combinations = task
+    return [what_if(worker_jack, state, seed, ipos) for ipos in combinations]
+
+##########################################
+# Asking side
+
+class WhatIfEvaluator:
+    # `workers` processes are started once and reused for every evaluation (1 evaluates in this process).
+    # `settings` are Jack's, see DEFAULT_SETTINGS.
+    def __init__(self, workers=None, settings=None):
+        self.workers = workers if workers is not None else os.cpu_count()
+        if self.workers > 1:
+            self.pool = multiprocessing.Pool(self.workers, initializer=init_worker, initargs=(settings,))
+        else:
+            self.pool = None
+            init_worker(settings)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+    # Every way the investigators could stand after their move: each one on a crossing within reach,
+    # no two on the same crossing
+    def combinations(self, jack):
+        options = [sorted(jack.investigator_crossing_options(num)) for num in range(3)]
+        return [ipos for ipos in itertools.product(*options) if len(set(ipos)) == 3]
+
+    # Yield a WhatIf for each combination as the results come in.  With a `budget` (in seconds) no new
+    # chunks are started once it has run out, so some combinations may be left out.
+    def evaluate(self, jack, seed=0, budget=None):
+        if not jack.game_in_progress:
+            raise ValueError("No game in progress")
+        state = jack.snapshot()
+        combinations = self.combinations(jack)
+        chunks = [combinations[start:start + CHUNK_COMBINATIONS] for start in range(0, len(combinations), CHUNK_COMBINATIONS)]
+        deadline = time.perf_counter() + budget if budget is not None else None
+
+        if self.pool is None:
+            for chunk in chunks:
+                if deadline is not None and time.perf_counter() > deadline:
+                    break
+                yield from evaluate_chunk((state, seed, chunk))
+            return
+
+        # Keep a couple of chunks queued per worker, so stopping at the deadline leaves little running
+        pending = deque()
+        chunks = deque(chunks)
+        while chunks or pending:
+            while chunks and len(pending) < 2 * self.workers and (deadline is None or time.perf_counter() < deadline):
+                pending.append(self.pool.apply_async(evaluate_chunk, ((state, seed, chunks.popleft()),)))
+            if not pending:
+                break
+            yield from pending.popleft().get()
+
+    # All the results of evaluate(), best for the investigators first
+    def ranked(self, jack, seed=0, budget=None):
+        return sorted(self.evaluate(jack, seed, budget), key=WhatIf.rank)
+
+def main():
+    parser = argparse.ArgumentParser(description="Rank the investigators' possible moves by what Jack would do next")
+    parser.add_argument("--seed", type=int, default=0, help="game to set up")
+    parser.add_argument("--moves", type=int, default=2, help="how many moves Jack makes before the question is asked")
+    parser.add_argument("--budget", type=float, default=None, help="seconds to spend (default: evaluate everything)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes (default: one per core)")
+    parser.add_argument("--top", type=int, default=10, help="how many combinations to list")
+    args = parser.parse_args()
+
+    session = GameSession()
+    session.start(args.seed)
+    for move in range(args.moves - 1):
+        session.move_jack()
+    jack = session.jack
+    print("Jack is at %s, %d moves from %s.  Investigators at %s." %
+          (jack.pos, jack.hop_count(jack.pos, jack.active_target), jack.active_target, jack.ipos))
+
+    evaluator = WhatIfEvaluator(args.workers)
+    start = time.perf_counter()
+    results = evaluator.ranked(jack, args.seed, args.budget)
+    elapsed = time.perf_counter() - start
+    evaluator.close()
+
+    for result in results[:args.top]:
+        outcome = "trapped" if result.winner == INVESTIGATORS_WIN else "%d from target" % result.distance
+        print("  %-22s Jack -> %-4s %s" % (", ".join(result.ipos), result.pos, outcome))
+    print("%d of %d combinations in %.1fs with %d workers (%.0f/s)" %
+          (len(results), len(evaluator.combinations(jack)), elapsed, args.workers, len(results) / elapsed))
+
+if __name__ == "__main__":
+    main()
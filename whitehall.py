@@ -21,232 +21,79 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 '''
-import networkx as nx
+import os
+import random
+import shutil
+import tempfile
 from jack import *
 from graph_data import *
-import re
+import board
+import paths
+import record
+from session import *
 
 SCALE=2 # How much to scale all the x, y coordinates
 
-ug = nx.DiGraph()
-for edge in edge_list:
-    ug.add_edge(edge[0], edge[1], weight=edge[2], transport=edge[3])
-
-investigators = ["y", "b", "r"]
-
 # Assign the x-y coordinates of everything
 for pair in positions:
     #jack.print(pair)
     pair[1][1] += 871
     pair[1][0] *= SCALE
     pair[1][1] *= SCALE 
-    ug.nodes[pair[0]]['pos'] = pair[1]
-
-# Print out nodes with missing positions for help when editing by hand
-for node in ug.nodes():
-    if 'pos' not in (ug.nodes[node]):
-        jack.print("        [\"%s\", [,-]]," % node)
 
-# We don't want the water or alley paths (edges) to be visible
-for u, v in ug.edges():
-    if (ug.edges[u, v]['transport'] == BOAT_MOVE) or (ug.edges[u, v]['transport'] == ALLEY_MOVE):
-        ug.edges[u, v]['color'] = "#ffffff"
-    else:
-        ug.edges[u, v]['color'] = "#000000"
+# The board as a networkx DiGraph, for Jack's "networkx" path finding backend.  Nothing else needs it,
+# and networkx is slow to import, so it is only built when asked for.
+def networkx_graph():
+    if networkx_graph.ug is None:
+        import networkx as nx
+        ug = nx.DiGraph()
+        for edge in edge_list:
+            ug.add_edge(edge[0], edge[1], weight=edge[2], transport=edge[3])
+
+        for name, pos in positions:
+            ug.nodes[name]['pos'] = pos
+
+        # Print out nodes with missing positions for help when editing by hand
+        for node in ug.nodes():
+            if 'pos' not in (ug.nodes[node]):
+                print("        [\"%s\", [,-]]," % node)
+
+        # We don't want the water or alley paths (edges) to be visible
+        for u, v in ug.edges():
+            if (ug.edges[u, v]['transport'] == BOAT_MOVE) or (ug.edges[u, v]['transport'] == ALLEY_MOVE):
+                ug.edges[u, v]['color'] = "#ffffff"
+            else:
+                ug.edges[u, v]['color'] = "#000000"
 
-reset_graph_color_and_shape(ug)
+        reset_graph_color_and_shape(ug)
+        networkx_graph.ug = ug
+    return networkx_graph.ug
+networkx_graph.ug = None
 
 ##########################################
 
-ipos = ["87c1", "77c1", "86c1"]
-jack = Jack(ug, ipos);
+# The game played through the GUI (whitehall_gui.py) or the command line (python whitehall.py).  Other games can be run headless with session.GameSession.
+ipos = list(DEFAULT_IPOS)
+session = GameSession(None, ipos, log_file='whitehall.log', echo=True)
+jack = session.jack
 
 jack.make_image()
 
 ##########################################
 
-def parse_ipos(user_input):
-    match = user_input
-    values = []
-    # Extract the alphanumeric values
-    if match:
-        values = match.split(',')
-        values = [value.strip() for value in values]
-        for value in values:
-            if 'c' not in value or not ug.has_node(value):
-                values = []
-                jack.print(value, " is not a valid investigator location.")
-                break;
-    return values;
-
-def parse_clues(user_input):
-    match = user_input
-    values = []
-    # Extract the alphanumeric values
-    if match:
-        values = match.split(',')
-        values = [value.strip() for value in values]
-        for value in values:
-            if 'c' in value or not ug.has_node(value):
-                values = []
-                jack.print(value, " is not a valid location.")
-                break;
-    return values;
-
-def parse_single_location(user_input):
-    if user_input:
-        value = user_input
-        value.strip()
-        if 'c' in value or not ug.has_node(value):
-            jack.print(value, " is not a valid location.")
-            value = "BAD"
-    return value
-
-def parse_single_crossing(user_input):
-    if user_input:
-        value = user_input
-        value.strip()
-        if 'c' not in value or not ug.has_node(value):
-            jack.print(value, " is not a valid crossing.")
-            value = "BAD"
-    return value
-
-def parse_cost(user_input):
-    # Use regular expression to match the alphanumeric values
-    match = user_input
-    values = []
-    # Extract the alphanumeric values
-    if match:
-        values = match.split(',')
-        values = [value.strip() for value in values]
-        if (len(values) != 2):
-            jack.print("Must enter two (and only two) locations")
-            return
-        for value in values:
-            if not ug.has_node(value):
-                values = []
-                jack.print(value, " is not a valid location.")
-                return
-        jack.print(nx.shortest_path_length(jack.graph, source=values[0], target=values[1], weight='safety_weight'))
-                
-                
-                
 def process_input(user_input):
-    # NOTE: This does only very rudimentary syntax checking. It is NOT a feature-rich UI
-    #       For example, it does simple substring matching for some commands.
-    jack.log_to_file("\033[1m>", user_input, "\033[0m")
-    
-    split_input = user_input.split(" ", 1)
-    command = split_input[0]
-    parms = split_input[-1]   # Note: this can end up being the same as command if no arguments were supplied
-    
-    if "jack" == command:
-        jack.move()
-        process_input.player_move_allowed = True
-        
-    elif "start" == command:
-        jack.reset()
-        process_input.player_move_allowed = True
-        
-    elif "godmode" == command:
-        if parms == "on":
-            jack.godmode = True
-            jack.print("Godmode is now on.")
-        elif parms == "off":
-            jack.godmode = False
-            jack.print("Godmode is now off.")
-        else:
-            jack.print("Usage: godmode <on,off>")
-        
-    elif "ipos" == command:
-        if (jack.godmode) or process_input.player_move_allowed:
-            values = parse_ipos(parms)
-            if (len(values) == 3):
-                jack.set_ipos(values)
-            else:
-                jack.print("Usage: ipos <pos1>, <pos2>, <pos3>")
-        else:
-            jack.print("It's Jack's turn to move now, not yours.")
-            
-    elif "status" == command:
-        jack.status()
-
-    elif "map" == command:
-        jack.make_image()
-        
-    elif "arrest" == command:
-        pos = parse_single_location(parms)
-        if (pos != "BAD"):
-            jack.arrest(pos)
-            process_input.player_move_allowed = False
-        
-    elif "clues" == command:
-        pos_list = parse_clues(parms)
-        if (len(pos_list) != 0):
-            jack.clue_search(pos_list)
-            process_input.player_move_allowed = False
-
-    elif command in investigators:
-        if (jack.godmode) or process_input.player_move_allowed:
-            pos = parse_single_crossing(parms)
-            if (pos != "BAD"):
-                i = investigators.index(command)
-                # I could just modify jack.ipos directly, but we use the API to ensure the map gets redrawn
-                ipos = jack.ipos
-                if pos in ipos and ipos.index(pos) != i:
-                    jack.print("Cannot move investigator to an already occupied space.")
-                else:
-                    ipos[i] = pos
-                    jack.set_ipos(ipos)
-        else:
-            jack.print("It's Jack's turn to move now, not yours.")
-    
-    elif jack.godmode and "jackpos" == command:
-        pos = parse_single_location(parms)
-        if (pos != "BAD"):
-            jack.pos = pos
-            jack.make_image()
-            
-    elif jack.godmode and "cost" == command:
-        parse_cost(parms)
-    
-    elif jack.godmode and "self_test" == command:
-        self_tests()
-        
-    elif "exit" == command:
-        exit()
-            
-    elif "help" == command:
-        jack.print("Commands are:")
-        jack.print(" \033[1mjack\033[0m:    Jack takes his turn")
-        jack.print(" \033[1mstart\033[0m:   Start a new game (CAUTION: typing this mid-game will RESTART the game)")
-        
-        jack.print(" \033[1mipos <pos1>, <pos2>, <pos3>\033[0m:  Enter the investigator locations")
-        jack.print(" \033[1my <pos1>\033[0m:  Move the yellow investigator")
-        jack.print(" \033[1mb <pos1>\033[0m:  Move the blue investigator")
-        jack.print(" \033[1mr <pos1>\033[0m:  Move the red investigator")
-        
-        jack.print(" \033[1mstatus\033[0m:    View the current game status")
-        jack.print(" \033[1marrest <pos>\033[0m:    Attempt arrest at the specified position")
-        jack.print(" \033[1mclues <pos1>,..,<posX>\033[0m:    Search for clues at the supplied locations in the specified order")
-        jack.print(" \033[1mmap\033[0m:    Force the map file to be updated immediately with the current game state")
-        jack.print(" \033[1mexit\033[0m:    Completely exit the program.")
-        jack.print(" \033[1mgodmode <on,off>\033[0m:    Toggle godmode")
-        jack.godmode_print("  \033[1mjackpos <pos>\033[0m:    Move Jack to the specified location for debugging")
-        jack.godmode_print("  \033[1mcost <pos1>, <pos2>\033[0m:    Show the distance between two vertices (for weight debugging)")
-        jack.godmode_print("  \033[1mself_test\033[0m:    Run some self-tests")
-    else:
-        jack.print("Unknown command.")
-
-process_input.player_move_allowed = True
+    return session.command(user_input)
 
 def command_line_ui():
     # Input loop
     while True:
-        if (jack.godmode):
-            user_input = input("\033[1mgodmode > \033[0m")
-        else:
-            user_input = input("\033[1m> \033[0m")
+        try:
+            if (jack.godmode):
+                user_input = input("\033[1mgodmode > \033[0m")
+            else:
+                user_input = input("\033[1m> \033[0m")
+        except EOFError:
+            user_input = "exit"
     
         if user_input == "exit":
             jack.print("Goodbye!")
@@ -254,39 +101,139 @@ def command_line_ui():
 
         process_input(user_input)
 
-def welcome():
+def welcome(gui=True):
     jack.print("   Welcome!")
     jack.print("   Type \033[1mhelp\033[0m at any time for a full list of commands.")
-    jack.print("   Use your mouse to drag the investigators to starting locations.")
+    if gui:
+        jack.print("   Use your mouse to drag the investigators to starting locations.")
+    else:
+        jack.print("   Type \033[1mipos\033[0m to place the investigators on their starting crossings.")
     jack.print("   Then type \033[1mstart\033[0m to begin the game.")
 
 def register_output_reporter(func):
-    jack.register_output_reporter(func)
+    session.register_output_reporter(func)
 
 def register_gui_self_test(func):
     register_gui_self_test.gui_self_test_func = func
 register_gui_self_test.gui_self_test_func = None
     
 def game_turn():
-    turn = jack.turn_count()-1
-    if turn < 0:
-        turn = 0
-    return turn
-
-#command_line_ui()
+    return session.game_turn()
 
 def check_edges():
     # Sanity check the map.  Make sure every edge is bi-directional.
-    for edge in ug.edges():
-        source = edge.source()
-        target = edge.target()
-        edge_back = ug.edge(target, source)
-        if edge_back is None:
-            print("No edge back for ", ug.vp.ids[source], ug.vp.ids[target])
+    g = board.graph
+    for u in range(len(board.node_names)):
+        for e in g.out_edges(u):
+            v = g.targets[e]
+            if u not in g.targets[g.offsets[v]:g.offsets[v+1]]:
+                print("No edge back for ", board.node_names[u], board.node_names[v])
+
+# The array board's searches against networkx's on the DiGraph: distances and every tied shortest path
+# on Jack's channels, with and without poisoned crossings.
+def check_paths():
+    try:
+        nx_paths = paths.NxPaths(networkx_graph())
+    except ImportError:
+        print("networkx is not installed, skipping the path checks")
+        return
+    csr_paths = paths.CsrPaths()
+    poisoned = board.WeightOverlay()
+    for loc in DEFAULT_IPOS:
+        poisoned.poison_location(loc)
+    locations = sorted(board.locations, key=board.node_id.get)
+    sources = locations[::10]
+    dests = locations[::7]
+    for overlay in (board.WeightOverlay(), poisoned):
+        for channel in ('weight', 'safety_weight'):
+            for src in sources:
+                csr = csr_paths.lengths_within(src, None, overlay, channel)
+                nx = nx_paths.lengths_within(src, None, overlay, channel)
+                if csr != nx:
+                    print("Distances from %s on %s differ from networkx" % (src, channel))
+                for dest in dests:
+                    if src == dest:
+                        continue
+                    csr = sorted(csr_paths.all_shortest_paths(src, dest, overlay, channel))
+                    nx = sorted(nx_paths.all_shortest_paths(src, dest, overlay, channel))
+                    if csr != nx:
+                        print("Shortest paths from %s to %s on %s differ from networkx" % (src, dest, channel))
+
+# random_shortest_path() should only ever draw shortest paths, and given enough draws, all of them
+def check_path_sampler():
+    csr_paths = paths.CsrPaths()
+    overlay = board.WeightOverlay()
+    rng = random.Random(0)
+    locations = sorted(board.locations, key=board.node_id.get)
+    for src in locations[::15]:
+        for dest in locations[::9]:
+            if src == dest:
+                continue
+            shortest = set(tuple(path) for path in csr_paths.all_shortest_paths(src, dest, overlay))
+            if len(shortest) > 12:
+                continue
+            # What random_shortest_path() does, with the search done once for all the draws
+            src_id, dest_id = board.node_id[src], board.node_id[dest]
+            pred = board.graph.shortest_path_predecessors(src_id, dest_id, overlay, 'safety_weight')
+            drawn = set(tuple(board.node_names[v] for v in paths.sample_shortest_path(pred, src_id, dest_id, rng))
+                        for draw in range(20 * len(shortest)))
+            if not drawn <= shortest:
+                print("Sampled a path from %s to %s that is not a shortest path" % (src, dest))
+            elif drawn != shortest:
+                print("Sampling from %s to %s only drew %d of its %d shortest paths" % (src, dest, len(drawn), len(shortest)))
+
+# The bitsets against what they stand for: the investigators' reach from every vertex against networkx,
+# and the bitset helpers against the name lists
+def check_bitsets():
+    try:
+        nx_paths = paths.NxPaths(networkx_graph())
+        for v, name in enumerate(board.node_names):
+            reach = nx_paths.lengths_within(name, board.INVESTIGATOR_REACH, None, 'i_weight')
+            if board.investigator_reach(v) != board.bitset(board.node_id[u] for u in reach):
+                print("Investigator reach from %s differs from networkx" % name)
+    except ImportError:
+        print("networkx is not installed, skipping the investigator reach check")
+    for v, name in enumerate(board.node_names):
+        if board.bitset_names(1 << v) != [name]:
+            print("bitset_names() is wrong for", name)
+    for name in board.crossings:
+        v = board.node_id[name]
+        if sorted(board.bitset_names(board.locations_around_bits(v))) != sorted(board.locations_around(v)):
+            print("locations_around_bits() differs from locations_around() for", name)
+    if board.bitset_names(board.crossing_bits) != sorted(board.crossings, key=board.node_id.get):
+        print("crossing_bits does not hold exactly the crossings")
+
+# Seeds a game record can't hold should be refused before the game starts, so nothing is half written,
+# and the largest one it can hold should come back out of the file unchanged
+def check_records():
+    directory = tempfile.mkdtemp()
+    filename = os.path.join(directory, "check.whr")
+    test_session = GameSession()
+    test_session.recorder = record.GameRecorder(filename)
+    for seed in (-1, record.MAX_SEED + 1):
+        if test_session.start(seed).ok:
+            print("Started a game from seed %d, which a game record can't hold" % seed)
+    test_session.start(record.MAX_SEED)
+    test_session.recorder.close()
+    seeds = [game.seed for game in record.read_games(filename)]
+    if seeds != [record.MAX_SEED]:
+        print("The game record holds the seeds", seeds, "instead of", record.MAX_SEED)
+    shutil.rmtree(directory)
 
 def self_tests():
     check_edges()
+    check_paths()
+    check_path_sampler()
+    check_bitsets()
+    check_records()
     if register_gui_self_test.gui_self_test_func is not None:
         register_gui_self_test.gui_self_test_func()
     jack.print("Self test complete.")
-    jack.print("Check shell console for any logged messages.")
\ No newline at end of file
+    jack.print("Check shell console for any logged messages.")
+
+session.self_test_func = self_tests
+
+# Play in the terminal, without the GUI (which is whitehall_gui.py).  Nothing here needs Qt.
+if __name__ == "__main__":
+    welcome(gui=False)
+    command_line_ui()
@@ -23,6 +23,7 @@ SOFTWARE.
 """
 import whitehall_render as wr
 import whitehall as wh
+import board
 from CircleWidget import *
 from pyqtree import Index
 import sys
@@ -47,7 +48,7 @@ from PyQt5.QtWidgets import (
     QGridLayout
 )
 from PyQt5.QtGui import QPixmap, QTransform
-from PyQt5.QtCore import Qt, QObject, QEvent
+from PyQt5.QtCore import Qt, QObject, QEvent, QThread, QTimer, pyqtSignal
 
 
 travel_images = ["nothing", "boat-100-white.png", "alley-100.png", "coach-100.png"]
@@ -58,6 +59,9 @@ quadtree = Index(bbox=(0, 0, 1800, 1800))
 INVESTIGATOR_HEIGHT = 47
 INVESTIGATOR_WIDTH = 10
 OVERLAY_WIDTH = 22
+
+# How far the map can be zoomed in, relative to the size that fits the window
+MAX_ZOOM = 4
 JACK_FIG_IMG = "images/jack_fig.png"
 
 # Recognize the ANSI escape sequence for BOLD text
@@ -107,7 +111,7 @@ class DragData:
          self.offset_y = 0
          self.investigator_id = None
          self.crossing = None
-         self.valid_crossings = []
+         self.valid_crossings = set()
 
 
 class CustomGraphicsView(QGraphicsView):
@@ -115,10 +119,27 @@ class CustomGraphicsView(QGraphicsView):
         super().__init__(parent)
         self.gui = gui
         self.drag_data = DragData(None, 0, 0)
+        self.zoom = 1
+
+    # Ctrl + mouse wheel zooms the map in and out around the mouse pointer
+    def wheelEvent(self, event):
+        if event.modifiers() & Qt.ControlModifier:
+            zoom = self.zoom * 1.25 ** (event.angleDelta().y() / 120)
+            zoom = min(max(zoom, 1), MAX_ZOOM)
+            self.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
+            self.scale(zoom / self.zoom, zoom / self.zoom)
+            self.zoom = zoom
+            # Zoomed in, the map no longer fits across, so it needs scrolling sideways as well
+            self.setHorizontalScrollBarPolicy(Qt.ScrollBarAsNeeded if zoom > 1 else Qt.ScrollBarAlwaysOff)
+            return
+        super().wheelEvent(event)
 
     def mousePressEvent(self, event):
         mapped_pos = self.mapToScene(event.pos())
         if event.button() == Qt.LeftButton:
+            if self.gui.command_thread is not None:
+                # Nobody moves while a command is running
+                return
             if not wh.jack.godmode and wh.jack.it_is_jacks_turn:
                 self.drag_data.item = None
                 self.drag_data.investigator_id = None
@@ -143,13 +164,13 @@ class CustomGraphicsView(QGraphicsView):
                     self.drag_data.offset_y = self.drag_data.start_y - mapped_pos.y()
                     # Get a list of all crossings 2 away and save it to the drag_data
                     if not wh.jack.game_in_progress:
-                        self.drag_data.valid_crossings = wh.starting_ipos
+                        self.drag_data.valid_crossings = set(wh.starting_ipos)
                     else:
-                        self.drag_data.valid_crossings = wh.jack.investigator_crossing_options(num)
+                        self.drag_data.valid_crossings = set(wh.jack.investigator_crossing_options(num))
                         # Remove crossings that are occupied by other investigators
                         for pos in wh.jack.ipos:
-                            if (pos != self.drag_data.crossing) and (pos in self.drag_data.valid_crossings):
-                                self.drag_data.valid_crossings.remove(pos)
+                            if pos != self.drag_data.crossing:
+                                self.drag_data.valid_crossings.discard(pos)
                     break;
         elif event.button() == Qt.RightButton:
             print("Right button pressed")
@@ -162,6 +183,7 @@ class CustomGraphicsView(QGraphicsView):
             if self.drag_data.crossing != None and self.drag_data.investigator_id != None:
                 # Save the ipos for this widget to the game state
                 wh.jack.ipos[self.drag_data.investigator_id] = self.drag_data.crossing
+                self.gui.investigator_crossings[self.drag_data.investigator_id] = self.drag_data.crossing
             
                 (x, y) = positions_dict[self.drag_data.crossing]
                 self.gui.investigator_imgs[self.drag_data.investigator_id].setPos(
@@ -191,7 +213,7 @@ class CustomGraphicsView(QGraphicsView):
             qy = mapped_pos.y()*self.gui.scale
             #print("Looking for crossing at:", qx, qy)
             id_list = quadtree.intersect((qx, qy, qx, qy))
-            if id_list and ("c" in id_list[0]) and (id_list[0] in self.drag_data.valid_crossings or wh.jack.godmode):
+            if id_list and (id_list[0] in board.crossings) and (id_list[0] in self.drag_data.valid_crossings or wh.jack.godmode):
                 # Enforce a 2 crossing movement limit unless game hasn't started or in godmode
                 
                 (id_x, id_y) = positions_dict[ id_list[0]]
@@ -216,13 +238,41 @@ def loadQPixmap(path):
     else:
         return pixmap
     
+# Runs one command on the game engine, away from the Qt main thread, so the window keeps responding while
+# Jack thinks.  Everything the engine reports comes back through WhiteHallGui.engine_output.
+class CommandThread(QThread):
+    def __init__(self, command, parent=None):
+        super().__init__(parent)
+        self.command = command
+
+    def run(self):
+        wh.process_input(self.command)
+
 class WhiteHallGui(QWidget):
+    # The engine's output (output type, arguments).  Emitted from the command thread it is queued, so the
+    # widgets are only ever touched from the main thread.
+    engine_output = pyqtSignal(object, tuple)
+
     def __init__(self):
         super().__init__()
 
+        # The command being run, and the timer animating the entry while it runs
+        self.command_thread = None
+        self.thinking_dots = 0
+        self.thinking_timer = QTimer(self)
+        self.thinking_timer.setInterval(400)
+        self.thinking_timer.timeout.connect(self.show_thinking)
+
         self.jack_token_pos = -1
         self.turn_buttons = []
         self.scale = 1
+
+        # (pixmap cache key, scale) -> the pixmap scaled for the map, see scaled()
+        self.scaled_pixmaps = {}
+
+        # The base image of the board, drawn on a thread of its own so the window can show up straight away
+        self.board_thread = wr.BoardRenderThread(wh.positions, wh.edge_list, self)
+        self.board_thread.rendered.connect(self.set_board_image)
         
         self.crime_dictionary = {}
         self.crime_ref_pixmap = loadQPixmap("images/crime_overlay.png")
@@ -232,6 +282,11 @@ class WhiteHallGui(QWidget):
         
         self.jack_path_dictionary = {}
         self.jack_path_ref_pixmap = loadQPixmap("images/jack_path_overlay.png")
+
+        # What the engine last said is on the board, see apply_board_changes()
+        self.investigator_crossings = [None, None, None]
+        self.jack_shown_pos = None
+        self.godmode_shown = False
         
         # Create the dictionary and quadtree for quick location lookups
         self.create_positions_dictionary()
@@ -302,10 +357,11 @@ class WhiteHallGui(QWidget):
         scroll_content = QWidget()
         self.image_scroll_area.setWidget(self.view)
         
-        self.pixmap_item = QGraphicsPixmapItem()
+        self.board_item = wr.BoardTileItem()
 
-        self.scene.addItem(self.pixmap_item)
-        self.position_investigators(add=True)
+        self.scene.addItem(self.board_item)
+        for num in range(0, 3):
+            self.scene.addItem(self.investigator_imgs[num])
         
         # Add the widgets to the splitter
         splitter.addWidget(left_widget)
@@ -354,38 +410,104 @@ class WhiteHallGui(QWidget):
         # Pass a function and some necessary UI elements to the game engine 
         # so it can post things to the GUI with the proper context
         wh.register_gui_self_test(self.self_test)
-        wh.register_output_reporter(self.process_output)    
+        self.engine_output.connect(self.show_engine_output)
+        wh.register_output_reporter(self.report_engine_output)
         wh.welcome()
-        self.refresh_board()
+        wh.jack.make_image()   # the first BOARD_DELTA_MSG puts everything on the board
+        self.board_thread.start()
     
+    # Called by the engine, on whichever thread it is running
+    def report_engine_output(self, output_type, *msg):
+        if output_type == wh.SPECIAL_TRAVEL_MSG:
+            # The card goes on the turn Jack is taking now, which is over by the time the message is shown
+            msg = msg + (wh.game_turn(),)
+        self.engine_output.emit(output_type, msg)
+
+    def show_engine_output(self, output_type, msg):
+        self.process_output(output_type, *msg)
+
     def process_command_helper(self, command):    
         # Append the command to the text view with bold formatting
         self.text_view.insertHtml(f"<br/><b>> {command}</b><br/>")
     
-        # Perform actions based on the command
-        wh.process_input(command)
+        # Perform actions based on the command on the command thread
+        self.command_thread = CommandThread(command, self)
+        self.command_thread.finished.connect(self.command_done)
+        self.thinking_dots = 0
+        self.show_thinking()
+        self.thinking_timer.start()
+        self.command_thread.start()
+        return False
+
+    def command_done(self):
+        self.thinking_timer.stop()
+        self.command_thread.deleteLater()
+        self.command_thread = None
         self.text_entry.setText("")
         self.text_entry.setReadOnly(False)
-        return False
+
+    def show_thinking(self):
+        self.text_entry.setText("Jack is thinking" + "." * (self.thinking_dots % 4))
+        self.thinking_dots += 1
 
     def processText(self):
+        if self.command_thread is not None:
+            return
         text = self.text_entry.text()
-        self.text_entry.setText("Jack is thinking...")
-        # Add your text processing logic here
+        if text.split(" ", 1)[0] == "exit":
+            # Quit from the main thread; the engine's exit() would only stop the command thread
+            QApplication.quit()
+            return
         self.text_entry.setReadOnly(True)
         self.process_command_helper(text)
+
+    # Let a command or the board drawing finish before the threads running them are destroyed
+    def closeEvent(self, event):
+        if self.command_thread is not None:
+            self.command_thread.wait()
+        self.board_thread.wait()
+        super().closeEvent(event)
         
     def resizeEvent(self, event):
         self.update_pixmap()
 
+    # The board image has been drawn (or loaded) by the board thread
+    def set_board_image(self, image):
+        self.board_item.set_image(image)
+        self.update_pixmap()
+
     def update_pixmap(self):
-        # NOTE: the board_graph_img is created globally at the start of the program
-        width = min(board_graph_img.width(), self.image_scroll_area.width())
-        self.scale = board_graph_img.width()/width
-        scaled_pixmap = board_graph_img.scaledToWidth(width, Qt.SmoothTransformation)
-        self.pixmap_item.setPixmap(scaled_pixmap) 
+        board_img = self.board_item.image
+        if board_img is None:
+            # Still being drawn, set_board_image() will be along
+            return
+        width = min(board_img.width(), self.image_scroll_area.width())
+        scale = board_img.width()/width
+        if scale == self.board_item.board_scale:
+            # Same size as before, nothing needs scaling or moving
+            return
+        # The board's tiles are drawn at whatever size the view needs, so only the overlays are rescaled
+        self.scale = scale
+        self.scaled_pixmaps = {}
+        self.board_item.set_board_scale(scale)
         #print("Calling refresh board from update_pixmap")
         self.refresh_board()
+
+    # `pixmap` scaled down to the map's current scale.  Smooth scaling is slow, so the result is kept
+    # until the scale changes.
+    def scaled(self, pixmap):
+        key = (pixmap.cacheKey(), self.scale)
+        scaled_pixmap = self.scaled_pixmaps.get(key)
+        if scaled_pixmap is None:
+            new_width = pixmap.width()/self.scale
+            scaled_pixmap = self.scaled_pixmaps[key] = pixmap.scaledToWidth(int(new_width), Qt.SmoothTransformation)
+        return scaled_pixmap
+
+    # Show `pixmap` at the current scale on a QGraphicsPixmapItem, unless it already is
+    def set_scaled_pixmap(self, item, pixmap):
+        scaled_pixmap = self.scaled(pixmap)
+        if item.pixmap().cacheKey() != scaled_pixmap.cacheKey():
+            item.setPixmap(scaled_pixmap)
         
 
     def create_positions_dictionary(self):
@@ -406,8 +528,8 @@ class WhiteHallGui(QWidget):
             self.text_view.verticalScrollBar().setValue(self.text_view.verticalScrollBar().maximum())
     
         elif (output_type == wh.SPECIAL_TRAVEL_MSG):
-            overlay = self.turn_buttons[wh.game_turn()+1]
-            travel_type = msg[0]
+            travel_type, turn = msg
+            overlay = self.turn_buttons[turn+1]
             image = QPixmap(f"images/{travel_images[travel_type]}")
             image_widget = QLabel()
             image_widget.setPixmap(image)
@@ -421,7 +543,7 @@ class WhiteHallGui(QWidget):
             
             # need a second image to cover the second turn the coach took
             if travel_type == wh.COACH_MOVE:
-                overlay = self.turn_buttons[wh.game_turn()+2]
+                overlay = self.turn_buttons[turn+2]
                 image_widget = QLabel()
                 image_widget.setPixmap(image)
                 overlay.addWidget(image_widget)
@@ -459,25 +581,9 @@ class WhiteHallGui(QWidget):
                     widget = overlay.widget(i)
                     if not (isinstance(widget, QLabel)):
                         widget.setVisible(True)
-            
-            # Remove all clues
-            for loc, item in self.clue_dictionary.items():
-                self.scene.removeItem(item)
-            self.clue_dictionary = {}
-            
-            # Remove all crimes
-            for loc, item in self.crime_dictionary.items():
-                self.scene.removeItem(item)
-            self.crime_dictionary = {}
-            
-            # Remove all godmode Jack path indicators
-            for loc, item in self.jack_path_dictionary.items():
-                self.scene.removeItem(item)
-            self.jack_path_dictionary = {}
 
-        else:
-            #print("Calling refresh board from process_outpt")
-            self.refresh_board()
+        elif (output_type == wh.BOARD_DELTA_MSG):
+            self.apply_board_changes(msg[0])
     
     def show_current_turn(self, curr_turn):
         # Reset all the buttons since they are not part of a group - we have to set each one manually
@@ -513,101 +619,89 @@ class WhiteHallGui(QWidget):
         curr_overlay.setCurrentIndex(jack_layer)
     
     
-    def show_crimes(self):
-        # We need a common scaled version of the crime indication overlay
-        new_width = self.crime_ref_pixmap.width()/self.scale
-        scaled_pixmap = self.crime_ref_pixmap.scaledToWidth(int(new_width), Qt.SmoothTransformation)
-        
-        # Reposition all the overlays based on the current map scale, adding any newly discovered crimes as needed
-        for crime in wh.jack.crimes:
-            if crime not in self.crime_dictionary:
-                crime_img = QGraphicsPixmapItem()
-                self.crime_dictionary[crime] = crime_img
-                self.scene.addItem(crime_img)
-                
-            self.crime_dictionary[crime].setPixmap(scaled_pixmap)
-            x, y = positions_dict[crime]
-            self.crime_dictionary[crime].setPos((x - OVERLAY_WIDTH)/self.scale, (y - OVERLAY_WIDTH)/self.scale)
-    
-    def show_clues(self):
-        # We need a common scaled version of the clue indication overlay
-        new_width = self.clue_ref_pixmap.width()/self.scale
-        scaled_pixmap = self.clue_ref_pixmap.scaledToWidth(int(new_width), Qt.SmoothTransformation)
-        
-        # Reposition all the overlays based on the current map scale, adding any newly discovered clues as needed
-        for clue in wh.jack.clues:
-            if clue not in self.clue_dictionary:
-                clue_img = QGraphicsPixmapItem()
-                self.clue_dictionary[clue] = clue_img
-                self.scene.addItem(clue_img)
-                
-            self.clue_dictionary[clue].setPixmap(scaled_pixmap)
-            x, y = positions_dict[clue]
-            self.clue_dictionary[clue].setPos((x - OVERLAY_WIDTH)/self.scale, (y - OVERLAY_WIDTH)/self.scale)
-        
+    # Apply a list of changes from a BOARD_DELTA_MSG (see session.py), touching only the items that changed
+    def apply_board_changes(self, changes):
+        for change in changes:
+            kind = change[0]
+            if kind == wh.TURN_CHANGED:
+                self.show_current_turn(change[1])
+                self.place_jack_on_turn_track(change[1])
+            elif kind == wh.INVESTIGATOR_MOVED:
+                self.investigator_crossings[change[1]] = change[2]
+                self.place_investigator(change[1])
+            elif kind == wh.CRIME_ADDED:
+                self.add_overlay(self.crime_dictionary, change[1], self.crime_ref_pixmap)
+            elif kind == wh.CRIME_REMOVED:
+                self.remove_overlay(self.crime_dictionary, change[1])
+            elif kind == wh.CLUE_ADDED:
+                self.add_overlay(self.clue_dictionary, change[1], self.clue_ref_pixmap)
+            elif kind == wh.CLUE_REMOVED:
+                self.remove_overlay(self.clue_dictionary, change[1])
+            elif kind == wh.PATH_ADDED:
+                self.add_overlay(self.jack_path_dictionary, change[1], self.jack_path_ref_pixmap)
+                self.jack_path_dictionary[change[1]].setVisible(self.godmode_shown)
+            elif kind == wh.PATH_REMOVED:
+                self.remove_overlay(self.jack_path_dictionary, change[1])
+            elif kind == wh.JACK_MOVED:
+                self.jack_shown_pos = change[1]
+                self.place_jack_figure()
+            elif kind == wh.GODMODE_CHANGED:
+                # Jack and the path he took are only shown in godmode
+                self.godmode_shown = change[1]
+                self.place_jack_figure()
+                for item in self.jack_path_dictionary.values():
+                    item.setVisible(self.godmode_shown)
+
+    # An overlay image on location `loc`, kept in `items` (one of the overlay dictionaries)
+    def add_overlay(self, items, loc, pixmap):
+        if loc not in items:
+            items[loc] = QGraphicsPixmapItem()
+            self.scene.addItem(items[loc])
+        self.place_overlay(items[loc], loc, pixmap)
+
+    def remove_overlay(self, items, loc):
+        item = items.pop(loc, None)
+        if item is not None:
+            self.scene.removeItem(item)
+
+    def place_overlay(self, item, loc, pixmap):
+        self.set_scaled_pixmap(item, pixmap)
+        x, y = positions_dict[loc]
+        item.setPos((x - OVERLAY_WIDTH)/self.scale, (y - OVERLAY_WIDTH)/self.scale)
+
+    def place_investigator(self, num):
+        crossing = self.investigator_crossings[num]
+        if crossing is None:
+            return
+        x, y = positions_dict[crossing]
+        self.set_scaled_pixmap(self.investigator_imgs[num], self.investigator_ref_pixmaps[num])
+        self.investigator_imgs[num].setPos((x - INVESTIGATOR_WIDTH)/self.scale, (y - INVESTIGATOR_HEIGHT)/self.scale)
+
+    def place_jack_figure(self):
+        if not self.jack_shown_pos:
+            self.jack_fig_item.setVisible(False)
+            return
+        if self.jack_fig_item.scene() is None:
+            self.scene.addItem(self.jack_fig_item)
+        x, y = positions_dict[self.jack_shown_pos]
+        self.set_scaled_pixmap(self.jack_fig_item, self.jack_fig_ref_pixmap)
+        self.jack_fig_item.setPos((x - INVESTIGATOR_WIDTH)/self.scale, (y - INVESTIGATOR_HEIGHT)/self.scale)
+        self.jack_fig_item.setVisible(self.godmode_shown)
+
+    # Lay everything on the map out again at the current scale.  What is shown only changes through
+    # apply_board_changes().
     def refresh_board(self):
-        curr_turn = wh.game_turn()
-        
-        self.show_current_turn(curr_turn)
-        self.place_jack_on_turn_track(curr_turn)
-        self.position_investigators()
-        
-        self.show_crimes()
-        self.show_clues()
-        
-        self.do_godmode_board_update()
+        for num in range(0, 3):
+            self.place_investigator(num)
+        for items, pixmap in ((self.crime_dictionary, self.crime_ref_pixmap), (self.clue_dictionary, self.clue_ref_pixmap),
+                              (self.jack_path_dictionary, self.jack_path_ref_pixmap)):
+            for loc, item in items.items():
+                self.place_overlay(item, loc, pixmap)
+        self.place_jack_figure()
         
         # Adjust the scene size to match the content size
         self.scene.setSceneRect(self.scene.itemsBoundingRect())
     
-
-    def position_investigators(self, add=False):
-        # Put the investigator playing pieces on the board
-        for num in range (0,3):
-            if add:
-                self.scene.addItem(self.investigator_imgs[num])
-            ipos = wh.jack.ipos[num]
-            x, y = positions_dict[ipos]
-            pixmap = self.investigator_ref_pixmaps[num]
-            new_width = pixmap.width()/self.scale
-            scaled_pixmap = pixmap.scaledToWidth(int(new_width), Qt.SmoothTransformation)
-            self.investigator_imgs[num].setPixmap(scaled_pixmap)
-            self.investigator_imgs[num].setPos((x - INVESTIGATOR_WIDTH)/self.scale, (y - INVESTIGATOR_HEIGHT)/self.scale)
-    
-
-    def do_godmode_board_update(self):
-        if wh.jack.pos == 0:
-            self.jack_fig_item.setVisible(False)
-        else:
-            if not self.jack_fig_item in self.scene.items():
-                self.scene.addItem(self.jack_fig_item)
-            x, y = positions_dict[wh.jack.pos]
-            pixmap = self.jack_fig_ref_pixmap
-            new_width = pixmap.width()/self.scale
-            scaled_pixmap = pixmap.scaledToWidth(int(new_width), Qt.SmoothTransformation)
-            self.jack_fig_item.setPixmap(scaled_pixmap)
-            self.jack_fig_item.setPos((x - INVESTIGATOR_WIDTH)/self.scale, (y - INVESTIGATOR_HEIGHT)/self.scale)
-            if not wh.jack.godmode:
-                self.jack_fig_item.setVisible(False)
-            else:
-                self.jack_fig_item.setVisible(True)
-                
-                # Show Jack's prior movements
-                # We need a common scaled version of the clue indication overlay
-                new_width = self.jack_path_ref_pixmap.width()/self.scale
-                scaled_pixmap = self.jack_path_ref_pixmap.scaledToWidth(int(new_width), Qt.SmoothTransformation)
-    
-                for path in wh.jack.path_used:
-                    if path not in self.jack_path_dictionary:
-                        path_img = QGraphicsPixmapItem()
-                        self.jack_path_dictionary[path] = path_img
-                        self.scene.addItem(path_img)
-            
-                    self.jack_path_dictionary[path].setPixmap(scaled_pixmap)
-                    x, y = positions_dict[path]
-                    self.jack_path_dictionary[path].setPos((x - OVERLAY_WIDTH)/self.scale, (y - OVERLAY_WIDTH)/self.scale)
-            
-    
     def self_test(self):
         print("GUI self tests completed.")
 
@@ -623,10 +717,6 @@ if __name__ == "__main__":
     signal.signal(signal.SIGINT, signal.SIG_DFL)
     #signal.signal(signal.SIGINT, handle_abort)   # only enabled for debugging
     
-    # Generate the base image for the board based on the nodes and edges defined.
-    board_graph = wr.BaseGraphView(wh.positions, wh.edge_list)
-    board_graph_img = board_graph.getPixmap()
-    
     # start the game
     window = WhiteHallGui()
     window.showMaximized()
@@ -22,22 +22,215 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 import whitehall as wh
+import board
+import math
 import sys
-from PyQt5.QtWidgets import QApplication, QMainWindow, QGraphicsView, QGraphicsScene, QGraphicsEllipseItem, QGraphicsRectItem, QGraphicsLineItem, QGraphicsTextItem
-from PyQt5.QtCore import Qt, QRectF
+from collections import OrderedDict
+from PyQt5.QtWidgets import QApplication, QMainWindow, QGraphicsView, QGraphicsScene, QGraphicsItem
+from PyQt5.QtCore import Qt, QPointF, QRectF, QThread, pyqtSignal
 from PyQt5.QtGui import QFont
 from PyQt5.QtGui import QBrush, QColor, QPen
 from PyQt5.QtGui import QPainter
-from PyQt5.QtGui import QPixmap
+from PyQt5.QtGui import QPixmap, QImage
 
 MAP_BOARD_IMG = "images/jack.png"
 
-def string_present(s, nested_array):
-    for sublist in nested_array:
-        if s in sublist:
-            return True
-    return False
+# Width and height of the rendered board
+BOARD_SIZE = 1770
+
+# Draw the board with `painter`, in board image coordinates.  Only QPainter and QImage are used, so this
+# works on any thread (the graphics view classes may only be used on the main thread).
+# With `area` (a QRectF in board image coordinates) only what shows in that part of the board is drawn.
+def paint_board(painter, positions, edges, area=None):
+    painter.setRenderHint(QPainter.Antialiasing)
+
+    # Node properties
+    r = 19
+
+    # Convert positions to a dictionary for easy lookup
+    position_dict = {name: (x, y) for name, [x, y] in positions}
+
+    # Everything drawn for a location lies within r + the outline's width of it
+    if area is not None:
+        left, top = area.left() - r - 3, area.top() - r - 3
+        right, bottom = area.right() + r + 3, area.bottom() + r + 3
+        positions = [(name, [x, y]) for name, [x, y] in positions if left <= x <= right and top <= y <= bottom]
+
+    # Draw edges
+    painter.setPen(QPen(QColor("black"), 2))
+    for start, end, _, edge_type in edges:
+        if edge_type == 0:
+            x1, y1 = position_dict[start]
+            x2, y2 = position_dict[end]
+            if area is not None and (max(x1, x2) < left or min(x1, x2) > right or max(y1, y2) < top or min(y1, y2) > bottom):
+                continue
+            painter.drawLine(QPointF(x1, y1), QPointF(x2, y2))
+
+    white_brush = QBrush(QColor("white"))  
+    water_brush = QBrush(QColor(wh.WATER_COLOR))
+    box_size = r / 1.5
+    black_brush = QBrush(QColor("black"))  # Fill color for the small crossings
+    gold_brush = QBrush(QColor(wh.STARTING_CROSSINGS_COLOR))  # Fill color for the starting crossings
+
+    # Outline properties
+    outline_color = QColor(173,173,173)
+    outline_width = 3
+    pen = QPen(outline_color, outline_width)
+
+    font = QFont()
+    font.setPixelSize(18)
+    painter.setFont(font)
+
+    # Draw nodes
+    for name, [x, y] in positions:
+        painter.setPen(pen)
+        if name in board.crossings:
+            # draw a small black box
+            if name in board.starting_crossings:
+                painter.setBrush(gold_brush)
+            else:
+                painter.setBrush(black_brush)
+            painter.drawRect(QRectF(x - box_size/2, y - box_size/2, box_size, box_size))
+        else:
+            font_color = QColor("black");
+            if name in board.quad_targets:
+                painter.setBrush(white_brush)
+            elif name in board.water_locations:
+                painter.setBrush(water_brush)
+            else:
+                font_color = QColor("white");
+                painter.setBrush(black_brush)
+            painter.drawEllipse(QRectF(x-r, y-r, 2*r, 2*r))
+
+            # Draw node label (centered)
+            painter.setPen(font_color)
+            painter.drawText(QRectF(x - 2*r, y - r, 4*r, 2*r), Qt.AlignCenter, name)
+
+# The board drawn onto a transparent BOARD_SIZE x BOARD_SIZE image.  A QImage rather than a QPixmap, since
+# only QImage can be painted outside the main thread.
+def render_board(positions, edges):
+    image = QImage(BOARD_SIZE, BOARD_SIZE, QImage.Format_ARGB32_Premultiplied)
+    image.fill(Qt.transparent)
+    painter = QPainter(image)
+    paint_board(painter, positions, edges)
+    painter.end()
+    return image
+
+# Draws the board away from the main thread and hands it over as a QImage
+class BoardRenderThread(QThread):
+    rendered = pyqtSignal(QImage)
+
+    def __init__(self, positions, edges, parent=None):
+        super().__init__(parent)
+        self.positions = positions
+        self.edges = edges
+
+    def run(self):
+        self.rendered.emit(render_board(self.positions, self.edges))
     
+# The board image as a graphics item made of tiles, drawn at the level of detail the view needs.
+#
+# Level 0 tiles are cut straight from the board image, level 1 tiles are half its size, level 2 a quarter,
+# and so on.  Zoomed in past the image's own size, the tiles (levels -1 and -2, at two and four times
+# its size) are drawn with paint_board() at that size, so the map stays sharp.  Tiles are only made when
+# they first come into view and are kept (up to BOARD_MAX_TILES of them), so resizing the window or
+# zooming back and forth never rescales the whole board.
+#
+# The item is shown at 1/board_scale of the board image's size, like everything else on the GUI's scene.
+BOARD_TILE_SIZE = 256
+BOARD_MIN_LEVEL = -2
+BOARD_MAX_LEVEL = 3
+
+# Most tiles kept (256x256 pixels each, so about 50MB), the least recently used going first.  A 4K screen
+# shows up to about 170 at once, and more than that would have to be made again on every repaint.
+BOARD_MAX_TILES = 200
+
+class BoardTileItem(QGraphicsItem):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+        self.image = None
+        self.board_scale = None
+        self.tiles = OrderedDict()   # (level, column, row) -> QPixmap, the least recently used first
+
+    def set_image(self, image):
+        self.prepareGeometryChange()
+        self.image = image
+        self.tiles = OrderedDict()
+        self.update()
+
+    def set_board_scale(self, board_scale):
+        self.prepareGeometryChange()
+        self.board_scale = board_scale
+        self.update()
+
+    def boundingRect(self):
+        if self.image is None or self.board_scale is None:
+            return QRectF()
+        return QRectF(0, 0, self.image.width() / self.board_scale, self.image.height() / self.board_scale)
+
+    # The level whose tiles have at least as many pixels as the screen shows for them
+    def level_for(self, device_scale):
+        level = math.floor(-math.log2(device_scale))
+        return min(max(level, BOARD_MIN_LEVEL), BOARD_MAX_LEVEL)
+
+    def tile(self, level, column, row):
+        key = (level, column, row)
+        pixmap = self.tiles.get(key)
+        if pixmap is None:
+            if len(self.tiles) >= BOARD_MAX_TILES:
+                self.tiles.popitem(last=False)
+            pixmap = self.tiles[key] = self.make_tile(level, column, row)
+        else:
+            self.tiles.move_to_end(key)
+        return pixmap
+
+    # The part of the board image a tile covers
+    def tile_source(self, level, column, row):
+        span = BOARD_TILE_SIZE * 2 ** level
+        return QRectF(column * span, row * span, span, span).intersected(QRectF(self.image.rect()))
+
+    def make_tile(self, level, column, row):
+        source = self.tile_source(level, column, row)
+        width = max(1, round(source.width() / 2 ** level))
+        height = max(1, round(source.height() / 2 ** level))
+        if level >= 0:
+            return QPixmap.fromImage(self.image.copy(source.toRect()).scaled(
+                width, height, Qt.IgnoreAspectRatio, Qt.SmoothTransformation))
+
+        # Zoomed in: draw the part of the board the tile covers at the tile's size
+        pixmap = QPixmap(width, height)
+        pixmap.fill(Qt.transparent)
+        painter = QPainter(pixmap)
+        painter.scale(2 ** -level, 2 ** -level)
+        painter.translate(-source.x(), -source.y())
+        paint_board(painter, wh.positions, wh.edge_list, source)
+        painter.end()
+        return pixmap
+
+    def paint(self, painter, option, widget=None):
+        if self.image is None or self.board_scale is None:
+            return
+        device_scale = painter.worldTransform().m11() * painter.device().devicePixelRatioF() / self.board_scale
+        level = self.level_for(device_scale)
+        span = BOARD_TILE_SIZE * 2 ** level
+
+        # The tiles under the part of the item being painted, in board image pixels
+        exposed = option.exposedRect
+        first_column = max(0, int(exposed.left() * self.board_scale // span))
+        last_column = min(int((self.image.width() - 1) // span), int(exposed.right() * self.board_scale // span))
+        first_row = max(0, int(exposed.top() * self.board_scale // span))
+        last_row = min(int((self.image.height() - 1) // span), int(exposed.bottom() * self.board_scale // span))
+
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        for row in range(first_row, last_row + 1):
+            for column in range(first_column, last_column + 1):
+                pixmap = self.tile(level, column, row)
+                source = self.tile_source(level, column, row)
+                target = QRectF(source.x() / self.board_scale, source.y() / self.board_scale,
+                                source.width() / self.board_scale, source.height() / self.board_scale)
+                painter.drawPixmap(target, pixmap, QRectF(pixmap.rect()))
+
 # Class to render the graph image of the playing board
 class BaseGraphView(QMainWindow):
     def __init__(self, positions, edges):
@@ -54,89 +247,11 @@ class BaseGraphView(QMainWindow):
         self.view.setRenderHint(QPainter.Antialiasing)
         self.setCentralWidget(self.view)
 
+        self.pixmap = QPixmap.fromImage(render_board(self.positions, self.edges))
         self.scene = QGraphicsScene()
+        self.scene.addPixmap(self.pixmap)
         self.view.setScene(self.scene)
 
-        # Convert positions to a dictionary for easy lookup
-        position_dict = {name: (x, y) for name, [x, y] in self.positions}
-
-        line_pen = QPen(QColor("black"), 2)
-
-        # Draw edges
-        for start, end, _, edge_type in self.edges:
-            if edge_type == 0:
-                x1, y1 = position_dict[start]
-                x2, y2 = position_dict[end]
-                line_item = QGraphicsLineItem(x1, y1, x2, y2)
-                line_item.setPen(line_pen)
-                self.scene.addItem(line_item)
-
-        # Node properties
-        r = 19
-        white_brush = QBrush(QColor("white"))  
-        water_brush = QBrush(QColor(wh.WATER_COLOR))
-        box_size = r / 1.5
-        black_brush = QBrush(QColor("black"))  # Fill color for the small crossings
-        gold_brush = QBrush(QColor(wh.STARTING_CROSSINGS_COLOR))  # Fill color for the starting crossings
-    
-        # Outline properties
-        outline_color = QColor(173,173,173)
-        outline_width = 3
-        pen = QPen(outline_color, outline_width)
-
-
-        # Draw nodes
-        for name, [x, y] in self.positions:
-            if 'c' in name:
-                # draw a small black box
-                rect = QGraphicsRectItem(QRectF(x - box_size/2, y - box_size/2, box_size, box_size))
-                if name in wh.starting_ipos:
-                    rect.setBrush(gold_brush)
-                else:
-                    rect.setBrush(black_brush)
-                rect.setPen(pen)
-                self.scene.addItem(rect)
-            else:
-                ellipse = QGraphicsEllipseItem(QRectF(x-r, y-r, 2*r, 2*r))
-                font_color = QColor("black");
-                if string_present(name, wh.quads):
-                    ellipse.setBrush(white_brush)
-                elif name in wh.water:
-                    ellipse.setBrush(water_brush)
-                else:
-                    font_color = QColor("white");
-                    ellipse.setBrush(black_brush)
-                ellipse.setPen(pen)
-                self.scene.addItem(ellipse)
-            
-                # Draw node label (centered)
-                label = QGraphicsTextItem(name)
-                font = QFont()
-                font.setPixelSize(18)
-                label.setFont(font)
-                label.setDefaultTextColor(font_color)
-                label_bound = label.boundingRect()
-                label.setPos(x - label_bound.width() / 2, y - label_bound.height() / 2)
-                self.scene.addItem(label)
-
-                self.pixmap = QPixmap(1770, 1770)
-                
-        self.pixmap.fill(Qt.transparent)
-
-        # Create a QPainter object and render the scene onto it
-        painter = QPainter(self.pixmap)
-        painter.setRenderHint(QPainter.Antialiasing)  # Enable anti-aliasing for the QPainter
-        
-        # Calculate the offset to center the scene within the QPixmap
-        offset_x = (1770 - self.scene.sceneRect().width()) / 2
-        offset_y = (1770 - self.scene.sceneRect().height()) / 2 - 12
-
-        # Render the scene to the QPixmap, centered
-        self.scene.render(painter, QRectF(offset_x, offset_y, self.scene.sceneRect().width(), self.scene.sceneRect().height()))
-
-        # End painting
-        painter.end()
-
     def getPixmap(self):
         return self.pixmap
         